@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+offline microbenchmarks for fmd's parsing and normalisation hot paths
+
+results are written as JSON, pass a previous run as --baseline to compare against it
+
+    python benchmarks/bench_hotpaths.py -o after.json --baseline before.json
+"""
+import gc
+import os
+import sys
+import json
+import timeit
+import logging
+import platform
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fmd'))
+
+import fmd
+import fmd_tools
+import fmd_synth
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, memory is counted in gc tracked objects instead
+    tracemalloc = None
+
+
+def process_cli():
+    parser = ArgumentParser(description='Benchmarks fmd parsing and normalisation hot paths')
+    parser.add_argument('-c', '--clients',
+        nargs='+',
+        type=int,
+        default=[10, 100, 1000, 10000],
+        help='Client counts to benchmark, default = 10 100 1000 10000')
+    parser.add_argument('-n', '--neighbours',
+        nargs='+',
+        type=int,
+        default=[0, 5, 50],
+        help='Neighbour WAP counts per client, default = 0 5 50')
+    parser.add_argument('-r', '--repeat',
+        type=int,
+        default=5,
+        help='Times each benchmark is repeated, best run is reported, default = 5')
+    parser.add_argument('-o', '--output',
+        help='Write results to a JSON file as well as stdout')
+    parser.add_argument('-b', '--baseline',
+        help='JSON results of a previous run to compare against')
+    return parser.parse_args()
+
+
+def measure(name, func, items, repeat, params=None):
+    '''
+    runs func over every item repeat times
+
+    Returns:
+        result dictionary with per call latency, throughput and the memory held by the results of
+        one pass, net traced bytes and peak where tracemalloc is available, otherwise the net change
+        in gc tracked objects
+    '''
+    def run():
+        for item in items:
+            func(item)
+
+    timings = [timeit.timeit(run, number=1) for _ in range(repeat)]
+    best = min(timings)
+    calls = len(items)
+    result = {
+        'name': name,
+        'params': params or {},
+        'calls': calls,
+        'best_secs': best,
+        'per_call_us': best / calls * 1e6,
+        'calls_per_sec': calls / best if best else None,
+        'net_alloc_bytes': None,
+        'alloc_peak_bytes': None,
+        'net_objects': None,
+    }
+
+    # memory is measured on a separate pass so tracing does not skew the timings, the results are
+    # kept until it is measured so it is not all freed again
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [func(item) for item in items]
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['net_alloc_bytes'] = current - before
+        result['alloc_peak_bytes'] = peak
+    else:
+        before = len(gc.get_objects())
+        kept = [func(item) for item in items]
+        gc.collect()
+        result['net_objects'] = len(gc.get_objects()) - before
+    del kept
+    return result
+
+
+def benchmarks(args):
+    results = []
+    hostnames = ['http://wlc%d.example.com:443/path' % i for i in range(1000)] + ['10.0.%d.%d' % (i // 250, i % 250) for i in range(1000)]
+    times = [i * 7.3 for i in range(10000)]
+
+    for neighbours in args.neighbours:
+        clients = fmd_synth.synthetic_clients(max(args.clients), neighbours)
+        outputs = [fmd_synth.client_detail(client) for client in clients]
+        for count in args.clients:
+            params = {'clients': count, 'neighbours': neighbours}
+            results.append(measure('ProfileWifiClient', fmd.ProfileWifiClient, outputs[:count], args.repeat, params))
+            details = [fmd.ProfileWifiClient(output).get_client_profile() for output in outputs[:count]]
+            results.append(measure('format_profile', fmd.format_profile, details, args.repeat, params))
+
+    macs = [fmd_synth.synthetic_mac(i) for i in range(max(args.clients))]
+    for count in args.clients:
+        params = {'clients': count}
+        results.append(measure('ProfileMAC', fmd.ProfileMAC, macs[:count], args.repeat, params))
+
+    results.append(measure('ProfileServer', fmd.ProfileServer, hostnames, args.repeat))
+    results.append(measure('format_time', fmd_tools.format_time, times, args.repeat))
+    return results
+
+
+def compare(results, baseline):
+    '''
+    adds the per call latency ratio against matching baseline results, above 1 is slower
+    '''
+    previous = dict((json.dumps([r['name'], r['params']], sort_keys=True), r) for r in baseline['results'])
+    for result in results:
+        match = previous.get(json.dumps([result['name'], result['params']], sort_keys=True))
+        if match is not None and match['per_call_us']:
+            result['baseline_ratio'] = result['per_call_us'] / match['per_call_us']
+
+
+def main():
+    args = process_cli()
+
+    # format_profile only logs at debug level, log to a null stream so formatting cost is included
+    logger = logging.getLogger('fmd')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+
+    results = benchmarks(args)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(results, json.load(f))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=4, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
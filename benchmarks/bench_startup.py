@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cold start benchmark for fmd, guards the start-up budget of --version, --help and importing fmd
+
+every measurement runs in a fresh interpreter, the exit status is 1 when the median time of any
+measurement is over budget or a heavy module is imported before a session is opened
+
+    python benchmarks/bench_startup.py --budget 150 -o startup.json
+"""
+import os
+import sys
+import json
+import platform
+import subprocess
+import timeit
+from argparse import ArgumentParser
+
+FMD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fmd')
+FMD_SCRIPT = os.path.join(FMD_DIR, 'fmd.py')
+
+# modules that should only load when a WLC session is opened or a feature needing them is used
+HEAVY_MODULES = ('netmiko', 'paramiko', 'cryptography', 'numpy', 'BaseHTTPServer', 'http.server')
+
+IMPORT_PROBE = '''
+import sys, json
+sys.path.insert(0, %r)
+import fmd
+print(json.dumps(sorted(m for m in %r if m in sys.modules)))
+''' % (FMD_DIR, HEAVY_MODULES)
+
+
+def process_cli():
+    parser = ArgumentParser(description='Benchmarks fmd cold start time')
+    parser.add_argument('-r', '--repeat',
+        type=int,
+        default=10,
+        help='Fresh interpreter runs per measurement, median is reported, default = 10')
+    parser.add_argument('--budget',
+        type=float,
+        default=150,
+        help='Median milliseconds allowed per measurement, default = 150')
+    parser.add_argument('-o', '--output',
+        help='Write results to a JSON file as well as stdout')
+    return parser.parse_args()
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def measure(name, command, repeat, budget):
+    '''
+    runs command in a fresh interpreter repeat times
+
+    Returns:
+        result dictionary with median and best wall time in milliseconds
+    '''
+    with open(os.devnull, 'w') as devnull:
+        def run():
+            subprocess.call(command, stdout=devnull, stderr=devnull)
+        timings = [timeit.timeit(run, number=1) * 1000 for _ in range(repeat)]
+    result = {
+        'name': name,
+        'median_ms': median(timings),
+        'best_ms': min(timings),
+        'budget_ms': budget,
+    }
+    result['over_budget'] = result['median_ms'] > budget
+    return result
+
+
+def heavy_imports():
+    '''
+    Returns:
+        list of heavy modules loaded by importing fmd
+    '''
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_PROBE])
+    return json.loads(output.decode('utf-8'))
+
+
+def main():
+    args = process_cli()
+
+    results = [
+        measure('interpreter', [sys.executable, '-c', 'pass'], args.repeat, args.budget),
+        measure('fmd --version', [sys.executable, FMD_SCRIPT, '--version'], args.repeat, args.budget),
+        measure('fmd --help', [sys.executable, FMD_SCRIPT, '--help'], args.repeat, args.budget),
+        measure('import fmd', [sys.executable, '-c', IMPORT_PROBE], args.repeat, args.budget),
+    ]
+    heavy = heavy_imports()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'heavy_imports': heavy,
+    }
+    print(json.dumps(report, indent=4, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(report, indent=4, sort_keys=True))
+
+    if heavy or any(result['over_budget'] for result in results):
+        sys.stderr.write('Start-up budget exceeded, heavy imports %s\n' % heavy)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+end to end load test of fmd's polling loop against a local simulated WLC
+
+starts fmd_simwlc in process, logs in through netmiko's cisco_wlc_ssh ConnectHandler and runs
+fmd's polling loop, then reports achieved samples/sec, cycle overruns and WLC command counts
+
+    python benchmarks/load_test.py --clients 1000 --frequency 5 --seconds 60 --latency 0.2 --mode disco
+"""
+import os
+import sys
+import json
+import logging
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fmd'))
+
+import fmd
+import fmd_simwlc
+import fmd_scheduler
+import fmd_pipeline
+
+
+def process_cli():
+    parser = ArgumentParser(description='Load tests fmd against a simulated WLC')
+    parser.add_argument('--clients',
+        default=1000,
+        type=int,
+        help='Number of monitored clients, default = 1000')
+    parser.add_argument('--neighbours',
+        default=5,
+        type=int,
+        help='Neighbour WAPs per client, default = 5')
+    parser.add_argument('-f', '--frequency',
+        default=5,
+        type=int,
+        choices=[5, 10, 15, 20, 25, 30],
+        help='fmd polling frequency in seconds, default = 5')
+    parser.add_argument('--seconds',
+        default=60,
+        type=float,
+        help='Duration of the load test, default = 60')
+    parser.add_argument('--mode',
+        default='plain',
+        choices=['plain', 'survey', 'disco'],
+        help='fmd LED mode, default = plain')
+    parser.add_argument('--bulk',
+        action='store_true',
+        help='Use fmd bulk polling')
+    parser.add_argument('--pipeline',
+        default=0,
+        type=int,
+        help='Commands fmd pipelines per round trip, default = 0 (off)')
+    parser.add_argument('--rtt',
+        default=0.0,
+        type=float,
+        help='Simulated network round trip seconds, default = 0')
+    parser.add_argument('--latency',
+        default=0.05,
+        type=float,
+        help='Simulated WLC seconds per command, default = 0.05')
+    parser.add_argument('--jitter',
+        default=0.0,
+        type=float,
+        help='Simulated WLC random +/- latency seconds, default = 0')
+    parser.add_argument('--roam',
+        default=0.01,
+        type=float,
+        help='Chance a client roams each time it is queried, default = 0.01')
+    parser.add_argument('-v', '--verbose',
+        action='store_true',
+        help='Show fmd console output')
+    return parser.parse_args()
+
+
+def main():
+    args = process_cli()
+    logging.basicConfig(stream=sys.stderr,
+                        level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(message)s')
+
+    # paramiko is very chatty at info level
+    logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    wlc = fmd_simwlc.SimulatedWLC(args.clients, args.neighbours, latency=args.latency, jitter=args.jitter, roam=args.roam)
+    server = fmd_simwlc.SimulatedWLCServer(wlc, rtt=args.rtt).start()
+
+    fmd_argv = ['-wlc', server.host, '-P', str(server.port), '-f', str(args.frequency)]
+    if args.mode == 'survey':
+        fmd_argv.append('-sm')
+    elif args.mode == 'disco':
+        fmd_argv.append('-dm')
+    if args.bulk:
+        fmd_argv.append('-b')
+    if args.pipeline:
+        fmd_argv.extend(['--pipeline', str(args.pipeline)])
+    fmd_args = fmd.process_cli(fmd_argv + wlc.macs())
+    fmd_args.minutes = args.seconds / 60.0
+
+    from netmiko import ConnectHandler
+    net_connect = ConnectHandler(device_type='cisco_wlc_ssh', ip=server.host, port=server.port, username='load', password='test')
+    if args.pipeline:
+        net_connect = fmd_pipeline.PipelinedSession(net_connect, args.pipeline)
+    start = fmd_scheduler.monotonic()
+    try:
+        stats = fmd.run_monitor(fmd_args, net_connect, wlc.macs())
+    finally:
+        elapsed = fmd_scheduler.monotonic() - start
+        net_connect.disconnect()
+        server.stop()
+
+    wlc_stats = wlc.stats()
+    target = float(args.clients) / args.frequency
+    report = {
+        'clients': args.clients,
+        'frequency': args.frequency,
+        'mode': args.mode,
+        'bulk': args.bulk,
+        'pipeline': args.pipeline,
+        'latency': args.latency,
+        'rtt': args.rtt,
+        'seconds': args.seconds,
+        'elapsed_seconds': elapsed,
+        'samples': stats['samples'],
+        'samples_per_sec': stats['samples'] / elapsed,
+        'target_samples_per_sec': target,
+        'scheduler': stats['scheduler'],
+        'led': stats['led'],
+        'wlc_commands': wlc_stats['commands'],
+        'wlc_led_flashes': wlc_stats['led_flashes'],
+    }
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,15 +11,35 @@ import json
 import getpass
 import logging
 import time
+import signal
 from datetime import datetime
-from netmiko import ConnectHandler
 from argparse import ArgumentParser, RawTextHelpFormatter      # Formatting help
 
 from _version import __version__
 import fmd_tools
-
-
-def process_cli():
+import fmd_scheduler
+import fmd_led
+import fmd_capture
+import fmd_daemon
+import fmd_events
+import fmd_store
+import fmd_location
+import fmd_metrics
+import fmd_profiles
+import fmd_logfile
+import fmd_session
+import fmd_pipeline
+import fmd_history
+import fmd_parse
+import fmd_coverage
+import fmd_watch
+import fmd_governor
+import fmd_profiler
+import fmd_rules
+import fmd_inventory
+
+
+def process_cli(argv=None):
     # processes cli arguments and usage guide
     parser = ArgumentParser(prog='fmd',
     description='''         Cisco Wirless Access Point WAP association monitoring tool, this assists with identifiying \n \
@@ -29,6 +49,9 @@ def process_cli():
         ## Windows and POSIX Users ## \n \
         python fmd.py -wlc 192.168.1.1 00:11:22:33:44:55 \n \
         python fmd.py -wlc 192.168.1.1 -p tyrone \n \
+        python fmd.py query -mac 00:11:22:33:44:55 -s "2017-11-01 09:00" -u "2017-11-01 17:00" \n \
+        python fmd.py locate -al waps.json -mac 00:11:22:33:44:55 -s "2017-11-01" \n \
+        python fmd.py parse show-client-detail.txt -o clients.jsonl \n \
         \n \
         ## Frozen ##
         fmd -wlc 192.168.1.1 00:11:22:33:44:55 \n \
@@ -46,11 +69,33 @@ def process_cli():
     g1.add_argument('-p', '--profile',
         nargs='?',
         default=False,
-        help='Enable profile settings')
+        help='Enable profile settings, several profiles are comma separated, reloaded when profiles.json changes')
+    parser.add_argument('--watch-ap',
+        action='append',
+        metavar=('{WAP name}'),
+        help='Monitor every client associated to this WAP, repeat for more WAPs')
+    parser.add_argument('--watch-ssid',
+        action='append',
+        metavar=('{SSID}'),
+        help='Monitor every client on this SSID, repeat for more SSIDs')
+    parser.add_argument('--watch-user',
+        action='append',
+        metavar=('{username}'),
+        help='Monitor every client of this username, repeat for more usernames')
+    parser.add_argument('--watch-refresh',
+        default='30',
+        type=int,
+        metavar=('{seconds}'),
+        help='Seconds between refreshes of the watched clients, default = 30')
     parser.add_argument('-wlc', '--wireless-lan-controller',
         type=str,
         metavar=('{ip address xx.xx.xx.xx}'),
         help='WLC management IP addresss')
+    parser.add_argument('-P', '--port',
+        default='22',
+        type=int,
+        metavar=('{port}'),
+        help='WLC SSH port, default = 22')
     parser.add_argument('-f', '--frequency',
         default='5',
         type=int,
@@ -69,18 +114,157 @@ def process_cli():
         choices=range(2, 10),
         metavar=('{2..10}'),
         help='Max WAPs when disco mode is enabled, default = 2')
+    parser.add_argument('-b', '--bulk',
+        action="store_true",
+        help='Enable bulk polling, one client summary per cycle and client details only on change')
+    parser.add_argument('-dr', '--detail-refresh',
+        default='60',
+        type=int,
+        metavar=('{seconds}'),
+        help='Max age of cached client details when bulk polling, default = 60')
+    parser.add_argument('--pipeline',
+        default='0',
+        type=int,
+        metavar=('{commands}'),
+        help='Poll every client once a cycle, sending this many show commands back to back per round trip, default = 0 (off)')
+    parser.add_argument('-a', '--adaptive',
+        action="store_true",
+        help='Poll moving clients every --frequency and back off stable or unassociated clients')
+    parser.add_argument('--max-interval',
+        default='60',
+        type=int,
+        metavar=('{seconds}'),
+        help='Longest adaptive polling interval, default = 60')
+    parser.add_argument('--budget',
+        default='0',
+        type=int,
+        metavar=('{commands}'),
+        help='Max client polls per --frequency seconds, 0 = unlimited, default = 0')
+    parser.add_argument('--rate',
+        default='0',
+        type=float,
+        metavar=('{commands/sec}'),
+        help='Max WLC commands per second, LED flashes only use tokens queries leave spare and queries go before WAP inventory refreshes, 0 = unlimited, default = 0')
+    parser.add_argument('--burst',
+        default='5',
+        type=int,
+        metavar=('{commands}'),
+        help='WLC commands sent back to back before --rate applies, default = 5')
+    parser.add_argument('--history',
+        default='0',
+        type=int,
+        metavar=('{samples}'),
+        help='Samples kept per client for signal average, min, max and roams, default = 0 (off)')
+    parser.add_argument('--history-memory',
+        default='16',
+        type=float,
+        metavar=('{MB}'),
+        help='Memory cap for --history, least recently seen clients are dropped, default = 16')
+    parser.add_argument('-e', '--events',
+        action="store_true",
+        help='Output JSON Lines events on client changes to stdout instead of logging every sample, logs go to stderr')
+    parser.add_argument('--hysteresis',
+        default='6',
+        type=int,
+        metavar=('{dB}'),
+        help='RSSI or SNR change in dB before an event is output, default = 6')
+    parser.add_argument('--heartbeat',
+        default='300',
+        type=int,
+        metavar=('{seconds}'),
+        help='Seconds between heartbeat events, 0 = disabled, default = 300')
+    parser.add_argument('--coverage',
+        action="store_true",
+        help='Report per WAP and SSID signal statistics at the end of the run and on SIGUSR1, always on in site survey mode')
+    parser.add_argument('--rules',
+        metavar=('{rules file}'),
+        help='Write JSON Lines events to stdout when clients match alert rules in this JSON file, logs go to stderr')
+    parser.add_argument('-s', '--store',
+        action="store_true",
+        help='Store client samples in the app dir for fmd query')
+    parser.add_argument('-al', '--ap-locations',
+        metavar=('{WAP locations file}'),
+        help='Estimate client positions using a JSON or CSV file of WAP x, y and floor')
+    parser.add_argument('--location-method',
+        default='centroid',
+        choices=fmd_location.METHODS,
+        help='Weighted centroid or path loss trilateration, default = centroid')
+    parser.add_argument('--inventory',
+        action="store_true",
+        help='Cache the WAP inventory so disco and site survey modes skip down or unknown WAPs')
+    parser.add_argument('--inventory-ttl',
+        default='300',
+        type=int,
+        metavar=('{seconds}'),
+        help='Seconds between background refreshes of the WAP inventory, default = 300')
     g2.add_argument('-dm', '--disco-mode',
         action="store_true",
         help='Enables follow me disco mode, default = disabled')
     g2.add_argument('-sm', '--sitesurvey-mode',
         action="store_true",
         help='Enables site survey mode, default = disabled')
+    parser.add_argument('--record',
+        metavar=('{capture file}'),
+        help='Record WLC commands and responses to a capture file')
+    parser.add_argument('--replay',
+        metavar=('{capture file}'),
+        help='Replay a capture file instead of connecting to a WLC')
+    parser.add_argument('--replay-speed',
+        default='1',
+        type=float,
+        metavar=('{speed}'),
+        help='Replay speed as a multiple of real time, 0 = as fast as possible, default = 1')
+    parser.add_argument('--daemon',
+        metavar=('{socket file}'),
+        help='Run as a daemon sharing one WLC session with watchers attached to a Unix socket')
+    parser.add_argument('--attach',
+        metavar=('{socket file}'),
+        help='Use the WLC session of a fmd daemon instead of connecting to a WLC')
+    parser.add_argument('--cache-ttl',
+        default='2',
+        type=float,
+        metavar=('{seconds}'),
+        help='Seconds a daemon reuses show command results for, default = 2')
+    parser.add_argument('--metrics',
+        action="store_true",
+        help='Collect command latency, parse time and polling metrics and log a summary on exit')
+    parser.add_argument('--metrics-port',
+        type=int,
+        metavar=('{port}'),
+        help='Serve metrics in Prometheus text format on http://127.0.0.1:port/metrics, implies --metrics')
+    parser.add_argument('--profile-run',
+        action="store_true",
+        help='Profile each polling cycle, writes a profile and hot spot summary to the app dir')
+    parser.add_argument('--profile-top',
+        default='20',
+        type=int,
+        metavar=('{functions}'),
+        help='Hot spots listed in the --profile-run summary, default = 20')
     parser.add_argument('-cv', '--console-verbose',
         action="store_true",
         help='Enable verbose console mode for SSH session')
     parser.add_argument('-l', '--log',
         action="store_true",
         help='Enable logging to a file')
+    parser.add_argument('--log-format',
+        default='text',
+        choices=fmd_logfile.FORMATS,
+        help='Log file format, default = text')
+    parser.add_argument('--log-max-size',
+        default='10',
+        type=float,
+        metavar=('{MB}'),
+        help='Rotate the log file when larger, 0 disables, default = 10')
+    parser.add_argument('--log-rotate',
+        default='24',
+        type=float,
+        metavar=('{hours}'),
+        help='Rotate the log file when older, 0 disables, default = 24')
+    parser.add_argument('--log-backups',
+        default='7',
+        type=int,
+        metavar=('{count}'),
+        help='Compressed log files kept, default = 7')
     parser.add_argument('-t', '--timestamp',
         action="store_true",
         help='Enable timestamping log output to console')
@@ -91,16 +275,20 @@ def process_cli():
         action='version',
         version='%(prog)s v'+__version__)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
 class Whitelist(logging.Filter):
+    # passes loggers whose names start with a whitelisted prefix, so every fmd module is included
     def __init__(self, *whitelist):
-        self.whitelist = [logging.Filter(name) for name in whitelist]
+        self.whitelist = tuple(whitelist)
 
     def filter(self, record):
-        return any(f.filter(record) for f in self.whitelist)
+        return record.name.startswith(self.whitelist)
+
+
+LOG_WHITELIST = Whitelist('fmd', '__main__')
 
 
 def configure_logging(args):
@@ -113,23 +301,25 @@ def configure_logging(args):
     Returns:
         logging: logging configuration
     """
+    # logs go to stderr so stdout is only JSON Lines events
+    stream = sys.stderr if args.events or args.rules else sys.stdout
     if args.debug:
-        logging.basicConfig(stream=sys.stdout,
+        logging.basicConfig(stream=stream,
                             #level=logging.INFO,
                             level=logging.DEBUG,
                             datefmt='%Y-%m-%d %H:%M:%S',
                             format='[%(asctime)s] [%(levelname)-5s] [%(name)s] %(message)s')
         for handler in logging.root.handlers:
-            handler.addFilter(Whitelist('fmd_tools', '__main__'))
+            handler.addFilter(LOG_WHITELIST)
         print_args(args)
 
     elif args.timestamp:
-        logging.basicConfig(stream=sys.stdout,
+        logging.basicConfig(stream=stream,
                             level=logging.INFO,
                             datefmt='%Y-%m-%d %H:%M:%S',
                             format='[%(asctime)s] %(message)s')
     else:
-        logging.basicConfig(stream=sys.stdout,
+        logging.basicConfig(stream=stream,
                             level=logging.INFO,
                             format='%(message)s')
     return logging    
@@ -150,53 +340,6 @@ def print_args(args):
     logger.debug('')
 
     
-def process_profiles(profiles_json):
-    logger = logging.getLogger(__name__)
-    logger.debug('JSON file %s', profiles_json)
-
-    json_data = False
-    ## Reading data back
-    with open(profiles_json, 'r') as f:
-         try:
-             json_data = json.load(f)
-             logger.info('Profiles loaded from JSON successfully')
-             logger.debug('JSON conversion %s', json_data)
-         except ValueError as err:
-             raise RuntimeError('JSON content bad %s' % err)
-         except Exception, err:
-             raise RuntimeError('JSON unknown error %s' % err)
-    return json_data
-    
-
-def get_profile_macs(profile, json_data):
-    logger = logging.getLogger(__name__)
-
-    # set profile name to use
-    if profile is not None:
-        active_profile = profile
-    else:
-        active_profile = json_data['Activate_profile']
-
-    logger.info('Profile chosen is %s', active_profile)
-
-    profile_macs = False
-    for key in json_data['profiles'].keys():
-        if key in active_profile:
-            profile_macs = json_data['profiles'][key]['macs']
-            logger.debug('Profile %s has MACs %s', active_profile, profile_macs)
-            break
-
-    if profile_macs:
-        if len(profile_macs) >= 1:
-            macs_to_monitor = profile_macs
-        else:
-            raise RuntimeError('Profile has no MACs, found %s' % len(profile_macs))
-    else:
-        raise RuntimeError('No profiles found matching name %s' % active_profile)
-
-    return macs_to_monitor
-
-
 class ProfileServer:
 
     def __init__(self, hostname):
@@ -296,85 +439,129 @@ class ProfileMAC:
             return False
 
 
+# show client detail lines used to build a client profile, the optional leading whitespace also
+# matches the indented test script output. Neighbour WAPs are listed as a WAP name line followed
+# by one line per antenna
+CLIENT_DETAIL_FIELDS = (
+    ('Client_MAC', r"Client.MAC.Address\.+\s(?P<Client_MAC>.+)"),
+    ('Username', r"Client.Username\s\.+\s(?P<Username>.+)"),
+    ('WAP_MAC', r"AP.MAC.Address\.+\s(?P<WAP_MAC>.+)"),
+    ('WAP_Name', r"AP.Name\.+\s(?P<WAP_Name>.+)"),
+    ('SSID', r"Wireless.LAN.Network.Name..SSID.\.+\s(?P<SSID>.+)"),
+    ('Signal', r"Radio.Signal.Strength.Indicator\.+\s(?P<Signal>.+)"),
+    ('SNR', r"Signal.to.Noise.Ratio\.+\s(?P<SNR>.+)"),
+    ('Neighbour', r"(?P<Neighbour>[A-Z0-9-_]+).slot.\d.\s*$"),
+    ('Antenna', r"antenna\d:\s(?P<Antenna>\d+)\ssec.*(?P<dBm>-\d{1,3}).dBm"),
+)
+CLIENT_DETAIL_REQUIRED = ('Client_MAC', 'Username', 'WAP_MAC', 'WAP_Name')
+rx_client_detail = re.compile(r"^[ \t]*(?:%s)" % '|'.join(rx for field, rx in CLIENT_DETAIL_FIELDS), re.MULTILINE)
+
+
 class ProfileWifiClient:
     '''
     builds a client profile and returns the profile in a dictionary
+
+    show client detail output is parsed in a single pass using the precompiled rx_client_detail
     '''
 
     def __init__(self, output):
 
-        self.output = output
         self.client_details = {
             'Status': False
         }
 
-        # real script
-        rx_sequence=re.compile(r"^Client.MAC.Address\.+\s(.+)\n^Client.Username\s\.+\s(.+)\n^AP.MAC.Address\.+\s(.+)\n^AP.Name\.+\s(.+)\n",re.MULTILINE)
-        # test script
-        #rx_sequence=re.compile(r"^\s+Client.MAC.Address\.+\s(.+)\n^\s+Client.Username\s\.+\s(.+)\n^\s+AP.MAC.Address\.+\s(.+)\n^\s+AP.Name\.+\s(.+)\n",re.MULTILINE)
-        for match in rx_sequence.finditer(self.output):
-            title = match.groups()
+        found = {}
+        neighbours = []
+        neighbour_wap = None
+        antennas = []
+        for match in rx_client_detail.finditer(output):
+            field = match.lastgroup
+            if field == 'dBm':
+                # antenna line, only use neighbours where both antennas were heard in the last 60 seconds
+                if neighbour_wap is None:
+                    continue
+                antennas.append((match.group('Antenna'), int(match.group('dBm'))))
+                if len(antennas) == 2:
+                    timeout = antennas[0][0]
+                    if int(timeout) < 60:
+                        avg_sig = (antennas[0][1] + antennas[1][1]) // 2
+                        neighbours.append((neighbour_wap, avg_sig, timeout))
+                    neighbour_wap = None
+            elif field == 'Neighbour':
+                neighbour_wap = match.group(field)
+                antennas = []
+            else:
+                found[field] = match.group(field).rstrip()
+
+        if all(field in found for field in CLIENT_DETAIL_REQUIRED):
             self.client_details['Status'] = True
-            self.client_details['Client_MAC'] = title[0].rstrip()
-            self.client_details['Username'] = title[1].rstrip()
-            self.client_details['WAP_MAC'] = title[2].rstrip()
-            self.client_details['WAP_Name'] = title[3].rstrip()
-            self.client_details['Signal'] = 'Not Detected'
-            self.client_details['SNR'] = 'Not Detected'
-            self.client_details['SSID'] = 'Not Detected'
-
-        if self.client_details['Status']:
-            # real script
-            rx_sequence=re.compile(r"^Wireless.LAN.Network.Name..SSID.\.+\s(.+)\n",re.MULTILINE)
-            # test script
-            #rx_sequence=re.compile(r"^\s+Wireless.LAN.Network.Name..SSID.\.+\s(.+)\n",re.MULTILINE)
-            for match in rx_sequence.finditer(self.output):
-                title = match.groups()
-                self.client_details['SSID'] = title[0].rstrip()
-
-            # real script
-            rx_sequence=re.compile(r"^\s+Radio.Signal.Strength.Indicator\.+\s(.+)\n^\s+Signal.to.Noise.Ratio\.+\s(.+)\n",re.MULTILINE)
-            # test script
-            #rx_sequence=re.compile(r"^\s+Radio.Signal.Strength.Indicator\.+\s(.+)\n^\s+Signal.to.Noise.Ratio\.+\s(.+)\n",re.MULTILINE)
-            for match in rx_sequence.finditer(self.output):
-                title = match.groups()
-                self.client_details['Signal'] = title[0].rstrip()
-                self.client_details['SNR'] = title[1].rstrip()
-
-            #print client_details
-            #logger.info('User %s MAC %s WAP %s SSID %s SS %s SNR %s', self.client_details['Username'], self.client_details['Client_MAC'], self.client_details['WAP_Name'], self.client_details['SSID'], self.client_details['Signal'], self.client_details['SNR'])
-
-            # real script
-            rx_sequence=re.compile(r"^\s+([A-Z0-9-_]+).slot.\d.\n^\s+antenna\d:\s([0-9]|[1-5][0-9])\ssec.*(-\d{1,3}).dBm\n^\s+antenna\d.*(-\d{1,3}).dBm",re.MULTILINE)
-            # test script
-            #rx_sequence=re.compile(r"^\s+([A-Z0-9-_]+).slot.\d.\n^\s+antenna\d:\s([0-9]|[1-5][0-9])\ssec.*(-\d{1,3}).dBm\n^\s+antenna\d.*(-\d{1,3}).dBm",re.MULTILINE)
-
-            # use output from WLC and list WAPs and there signal strengths
-            self.lol_signals = []
-            for match in rx_sequence.finditer(self.output):
-                title = match.groups()
-                self.lol_signals.append(title)
-            #logger.debug('DiscoMode matches %s', rx_sequence)
-            #logger.debug('WAPs signal %s', lol_signals)
-
-
-            # get signal strength average
-            self.lol_signals_mean = []
-            for wap, timeout, lv1, lv2 in self.lol_signals:
-                avg_sig = ((int(lv1) + int(lv2)) / 2)
-                wap_avg_sig = wap, avg_sig, timeout
-                self.lol_signals_mean.append(wap_avg_sig)
-            #logger.debug('WAPs Average signal %s', self.lol_signals_mean)
+            self.client_details['Client_MAC'] = found['Client_MAC']
+            self.client_details['Username'] = found['Username']
+            self.client_details['WAP_MAC'] = found['WAP_MAC']
+            self.client_details['WAP_Name'] = found['WAP_Name']
+            self.client_details['Signal'] = found.get('Signal', 'Not Detected')
+            self.client_details['SNR'] = found.get('SNR', 'Not Detected')
+            self.client_details['SSID'] = found.get('SSID', 'Not Detected')
 
             # sort by signal strength in reverse order
-            self.lol_signals_mean.sort(key=lambda x: x[1], reverse=True)
-            self.client_details['WAP_Neighbours'] = self.lol_signals_mean
+            neighbours.sort(key=lambda x: x[1], reverse=True)
+            self.client_details['WAP_Neighbours'] = neighbours
 
     def get_client_profile(self):
         return self.client_details
+
+
+class ProfileClientSummary:
+    '''
+    builds a summary of all clients known to the WLC and returns it in a dictionary keyed by cleaned MAC
+    '''
+
+    def __init__(self, output):
+
+        self.clients = {}
+
+        # MAC Address       AP Name           Slot Status        WLAN  Auth Protocol ...
+        rx_sequence=re.compile(r"^\s*([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s+(\S+)\s+\d+\s+(\S+)(?:\s+(\d+))?",re.MULTILINE)
+        for match in rx_sequence.finditer(output):
+            title = match.groups()
+            cleaned_mac = title[0].replace(':', '').lower()
+            self.clients[cleaned_mac] = {
+                'WAP_Name': title[1],
+                'Associated': title[2] == 'Associated',
+                'WLAN_ID': int(title[3]) if title[3] else None,
+            }
+
+    def get_clients(self):
+        return self.clients
+
+
+class ProfileWlanSummary:
+    '''
+    builds a dictionary of WLAN id to SSID from show wlan summary
+    '''
+
+    def __init__(self, output):
+
+        self.wlans = {}
+
+        # WLAN ID  WLAN Profile Name / SSID               Status    Interface Name ...
+        rx_sequence=re.compile(r"^\s*(\d+)\s+.+?\s/\s(.+?)\s+(?:Enabled|Disabled)\s",re.MULTILINE)
+        for match in rx_sequence.finditer(output):
+            self.wlans[int(match.group(1))] = match.group(2)
+
+    def get_wlans(self):
+        return self.wlans
+
+
+def client_macs(output):
+    '''
+    returns the cleaned MACs listed in a show client username table
+    '''
+    rx_sequence=re.compile(r"^\s*([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s",re.MULTILINE)
+    return [match.group(1).replace(':', '').lower() for match in rx_sequence.finditer(output)]
+
     
-    
-def format_profile(client_details):
+def format_profile(client_details, history_view=None):
     logger = logging.getLogger(__name__)
 
     logger.debug('')
@@ -397,50 +584,547 @@ def format_profile(client_details):
             logger.debug('Client profile - No Neighbouring WAPs Detected')
     else:
         logger.debug('Client profile - Status is False')
+    if history_view is not None:
+        logger.debug('Client profile - History %s samples, %s associated, %s roams', history_view['samples'], history_view['associated'], history_view['roams'])
+        logger.debug('Client profile - History Signal avg %s min %s max %s', history_view['rssi_avg'], history_view['rssi_min'], history_view['rssi_max'])
+        logger.debug('Client profile - History SNR avg %s min %s max %s', history_view['snr_avg'], history_view['snr_min'], history_view['snr_max'])
     #logger.debug('')
 
 
-def site_survey_mode(net_connect, client_details, flash_secs):
-    logger = logging.getLogger(__name__)
-    cli_cmd = 'config ap led-state flash %s %s' % (flash_secs, client_details['WAP_Name'])
-    logger.debug('Survey Mode - Command sent to WLC %s', cli_cmd)
+def parse_client_profile(output):
+    if fmd_metrics.registry is None and fmd_profiler.profiler is None:
+        return ProfileWifiClient(output).get_client_profile()
+    if fmd_profiler.profiler is not None:
+        mark = fmd_profiler.profiler.mark()
+    start = fmd_scheduler.monotonic()
+    client_details = ProfileWifiClient(output).get_client_profile()
+    if fmd_metrics.registry is not None:
+        fmd_metrics.registry.parse_seconds.observe(fmd_scheduler.monotonic() - start)
+    if fmd_profiler.profiler is not None:
+        fmd_profiler.profiler.record('parse', mark)
+    return client_details
+
+
+def query_client_profile(net_connect, mac):
+    '''
+    queries WLC for a single client and returns its client_details
+    '''
+    cli_cmd = 'show client detail %s' % mac.standard_mac()
     output = net_connect.send_command(cli_cmd)
-    logger.debug('Survey Mode - WLC response %s', output)
+    return parse_client_profile(output)
+
+
+def query_client_profiles(net_connect, macs):
+    '''
+    queries WLC for several clients in one batch, pipelined when the session supports it,
+    yielding (mac, client_details) as each client's output arrives
+    '''
+    commands = ['show client detail %s' % mac.standard_mac() for mac in macs]
+    for index, output in enumerate(fmd_session.send_commands(net_connect, commands)):
+        yield macs[index], parse_client_profile(output)
+
+
+def bulk_client_profile(net_connect, mac, summary, detail_cache, detail_refresh, now):
+    '''
+    returns client_details for a client using the per cycle client summary, client detail is only
+    queried when the client's association or WAP changed or the cached detail is older than detail_refresh
+
+    Args:
+        summary: clients from ProfileClientSummary
+        detail_cache: dict of cleaned MAC to (WAP name, client_details, time fetched), updated in place
+        now: current scheduler clock time
+
+    Returns:
+        (client_details, cached) where cached is True when client_details is a previous sample reused
+    '''
+    logger = logging.getLogger(__name__)
+    key = mac.cleaned_mac().lower()
+    client = summary.get(key)
+
+    if client is None or not client['Associated']:
+        detail_cache.pop(key, None)
+        return {'Status': False}, False
+
+    cached = detail_cache.get(key)
+    if cached is not None:
+        wap_name, client_details, fetched = cached
+        if wap_name == client['WAP_Name'] and now - fetched < detail_refresh:
+            logger.debug('Bulk mode - Using cached details for %s', mac.standard_mac())
+            return client_details, True
+
+    logger.debug('Bulk mode - Querying details for %s', mac.standard_mac())
+    client_details = query_client_profile(net_connect, mac)
+    if client_details['Status']:
+        detail_cache[key] = client['WAP_Name'], client_details, now
+    else:
+        detail_cache.pop(key, None)
+    return client_details, False
+
+
+def report_client(args, led_planner, formatted_time, mac, client_details, max_waps, event_tracker=None, history=None, inventory=None):
+    '''
+    logs a client's association details and targets WAP LEDs when enabled,
+    with an event_tracker only changes are output as events, with a history signal is summarised,
+    with an inventory only WAPs that are up are targeted
+    '''
+    logger = logging.getLogger(__name__)
+
+    history_view = None
+    if history is not None:
+        history_view = history.summary(mac.standard_mac())
+
+    if args.debug:
+        format_profile(client_details, history_view)
+
+    if event_tracker is not None:
+        event_tracker.update(mac.standard_mac(), client_details)
+
+    if client_details['Status']:
+        # if device has just connected and some values are still unknown
+        # or being connected for some time and has neighbours
+        if not fmd_tools.client_timed_out(client_details):
+            if event_tracker is None and history_view is not None and history_view['samples'] > 1:
+                logger.info('%s User %s MAC %s WAP %s SSID %s SS %s SNR %s - %s', formatted_time, client_details['Username'], client_details['Client_MAC'], client_details['WAP_Name'], client_details['SSID'], client_details['Signal'], client_details['SNR'], fmd_history.format_summary(history_view))
+            elif event_tracker is None:
+                logger.info('%s User %s MAC %s WAP %s SSID %s SS %s SNR %s', formatted_time, client_details['Username'], client_details['Client_MAC'], client_details['WAP_Name'], client_details['SSID'], client_details['Signal'], client_details['SNR'])
+            if args.sitesurvey_mode:
+                site_survey_mode(led_planner, client_details, inventory)
+            elif args.disco_mode:
+                disco_mode(led_planner, client_details, max_waps, inventory)
+        # else the device has not spoken to WLC in more than 60 seconds it means it has disappeared
+        # and WLC will hang on to association for another 5 minutes
+        elif event_tracker is None:
+            logger.info('%s User %s MAC %s WAP %s SSID %s - timeout greater than 60 seconds', formatted_time, client_details['Username'], client_details['Client_MAC'], client_details['WAP_Name'], client_details['SSID'])
+    elif event_tracker is None:
+        logger.info('%s Client with MAC %s is not associated with WLC', formatted_time, mac.standard_mac())
+
+
+def report_locations(location_engine, formatted_time, located):
+    '''
+    logs estimated positions for a batch of (MAC, client_details)
+    '''
+    logger = logging.getLogger(__name__)
+    samples = [[(wap, avg_sig) for wap, avg_sig, timeout in client_details['WAP_Neighbours']] for mac, client_details in located]
+    x, y, floor, used = location_engine.estimate_samples(samples)
+    for index, (mac, client_details) in enumerate(located):
+        if used[index]:
+            logger.info('%s MAC %s Location x %.1f y %.1f floor %s WAPs %s', formatted_time, mac, x[index], y[index], floor[index], used[index])
+        else:
+            logger.debug('Location - No WAPs with known locations heard by %s', mac)
+
+
+def site_survey_mode(led_planner, client_details, inventory=None):
+    logger = logging.getLogger(__name__)
+    if inventory is not None and not inventory.is_up(client_details['WAP_Name']):
+        logger.debug('Survey Mode - Skipping WAP %s, down or not in inventory', client_details['WAP_Name'])
+        inventory.skipped += 1
+        return
+    logger.debug('Survey Mode - Targeting WAP %s', client_details['WAP_Name'])
+    led_planner.target(client_details['WAP_Name'])
+    if fmd_metrics.registry is not None:
+        fmd_metrics.registry.led_targets.inc(mode='survey')
        
         
-def disco_mode(net_connect, client_details, flash_secs, max_waps):
+def disco_mode(led_planner, client_details, max_waps, inventory=None):
     logger = logging.getLogger(__name__)
 
     # seperate WAPs with highest signal, store only their name
     logger.debug('Disco mode - %s WAPS found', len(client_details['WAP_Neighbours']))
     target_waps = []
+    skipped_waps = set()
     # add associated WAP as first target
-    target_waps.append(client_details['WAP_Name'])
+    if inventory is None or inventory.is_up(client_details['WAP_Name']):
+        target_waps.append(client_details['WAP_Name'])
+    else:
+        skipped_waps.add(client_details['WAP_Name'])
     for x in client_details['WAP_Neighbours']:
         if len(target_waps) > max_waps:
             break
-        if x[0] not in target_waps:
+        if x[0] in target_waps or x[0] in skipped_waps:
+            continue
+        if inventory is None or inventory.is_up(x[0]):
             target_waps.append(x[0])
+        else:
+            skipped_waps.add(x[0])
+    # make up for skipped WAPs with neighbours other clients of the associated WAP have heard
+    if inventory is not None:
+        if skipped_waps:
+            logger.debug('Disco mode - Skipping WAPs %s, down or not in inventory', sorted(skipped_waps))
+            inventory.skipped += len(skipped_waps)
+        for wap in inventory.neighbours(client_details['WAP_Name']):
+            if len(target_waps) > max_waps:
+                break
+            if wap not in target_waps and inventory.is_up(wap):
+                target_waps.append(wap)
     logger.debug('Disco mode - %s WAPS will be used %s', len(target_waps), target_waps)
 
     for wap in target_waps:
-        cli_cmd = 'config ap led-state flash %s %s' % (flash_secs, wap)
-        logger.debug('Disco Mode - Command sent to WLC %s', cli_cmd)
-        output = net_connect.send_command(cli_cmd)
-        logger.debug('Disco Mode - WLC response %s', output)
+        led_planner.target(wap)
+    if fmd_metrics.registry is not None:
+        fmd_metrics.registry.led_targets.inc(len(target_waps), mode='disco')
+
+
+def open_session(args, sleep):
+    '''
+    opens a WLC session, a fmd daemon's session or a replay of a capture file, and wraps it for recording when enabled
+
+    Raises:
+        ValueError: if the WLC address is invalid
+    '''
+    if args.replay:
+        net_connect = fmd_capture.ReplaySession(args.replay, sleep)
+    elif args.attach:
+        net_connect = fmd_daemon.DaemonSession(args.attach)
+    else:
+        # netmiko pulls in paramiko and every device driver, only load it when connecting to a WLC
+        from netmiko import ConnectHandler
+        a = ProfileServer(args.wireless_lan_controller)
+
+        if args.events or args.rules:
+            # the prompt stays off stdout, which only carries events
+            sys.stderr.write('Username: ')
+            username = raw_input()
+        else:
+            username = raw_input('Username: ')
+        password = getpass.getpass()
+        conn_dict = {
+            'device_type': 'cisco_wlc_ssh',
+            'ip' : a.cleaned_domain(),
+            'port' : args.port,
+            'username' : username,
+            'password' : password,
+            'verbose': args.console_verbose,
+        }
+        try:
+            net_connect = ConnectHandler(**conn_dict)
+        finally:
+            del username, password, conn_dict
+        if args.pipeline:
+            net_connect = fmd_pipeline.PipelinedSession(net_connect, args.pipeline)
+
+    if args.record:
+        net_connect = fmd_capture.CaptureSession(net_connect, args.record)
+    return net_connect
+
+
+def index_macs(macs, clients):
+    '''
+    validates MACs once, adding a ProfileMAC keyed by standard MAC to clients for each new MAC
+
+    Returns:
+        list of standard MACs added
+    '''
+    logger = logging.getLogger(__name__)
+    added = []
+    for mac in macs:
+        try:
+            a = ProfileMAC(mac)
+        except ValueError as err:
+            logger.error('%s Skipping', err)
+            continue
+        if a.standard_mac() not in clients:
+            clients[a.standard_mac()] = a
+            added.append(a.standard_mac())
+    return added
+
+
+# scheduler key of the watched clients refresh slot, MAC keys are standard MAC strings
+WATCH_KEY = 'watch'
+
+
+def watching(args):
+    return bool(args.watch_ap or args.watch_ssid or args.watch_user)
+
+
+def refresh_watch(net_connect, client_index, args, wlans):
+    '''
+    refreshes client_index from the WLC, show wlan summary is only queried when a WLAN id is unknown
+
+    Returns:
+        list of standard MACs of the watched clients
+    '''
+    logger = logging.getLogger(__name__)
+    if args.watch_ap or args.watch_ssid:
+        summary = ProfileClientSummary(net_connect.send_command('show client summary')).get_clients()
+        if args.watch_ssid and any(client['WLAN_ID'] not in wlans for client in summary.values() if client['WLAN_ID'] is not None):
+            wlans.update(ProfileWlanSummary(net_connect.send_command('show wlan summary')).get_wlans())
+        client_index.update_summary(summary, wlans)
+    for username in args.watch_user or ():
+        client_index.update_username(username, client_macs(net_connect.send_command('show client username %s' % username)))
+    selected = client_index.select(args.watch_ap, args.watch_ssid, args.watch_user)
+    logger.debug('Watch - %s clients selected, index %s', len(selected), client_index.stats())
+    return [ProfileMAC(mac).standard_mac() for mac in sorted(selected)]
+
+
+def update_monitored(args, scheduler, clients, monitored, detail_cache, added, removed):
+    '''
+    adds and removes clients being monitored, only new MACs are validated
+
+    Returns:
+        new list of monitored standard MACs
+    '''
+    for mac in removed:
+        clients.pop(mac, None)
+        detail_cache.pop(mac.replace(':', '').lower(), None)
+        if not args.bulk and not args.pipeline:
+            scheduler.remove(mac)
+    added = index_macs(added, clients)
+    if not args.bulk and not args.pipeline:
+        scheduler.add_all(added)
+    if not added and not removed:
+        return monitored
+    removed = set(removed)
+    return [mac for mac in monitored if mac not in removed] + added
+
+
+def run_monitor(args, net_connect, macs_to_monitor, clock=fmd_scheduler.monotonic, sleep=time.sleep, sample_writer=None, location_engine=None, profile_store=None, rules_engine=None, inventory=None):
+    '''
+    polls and reports clients until args.minutes has passed, storing samples with sample_writer,
+    estimating positions with location_engine and following profile_store changes when given
+
+    Returns:
+        dictionary of client samples taken and scheduler and LED planner statistics
+    '''
+    logger = logging.getLogger(__name__)
+    duration = args.minutes * 60
+    flash_secs = args.frequency + 5
+    max_waps = args.max_waps - 1
+
+    detail_cache = {}
+    samples = 0
+    scheduler = fmd_scheduler.Scheduler(args.frequency, duration, clock, sleep, args.budget)
+    adaptive_policy = None
+    if args.adaptive and not args.bulk and not args.pipeline:
+        adaptive_policy = fmd_scheduler.AdaptivePolicy(args.frequency, args.max_interval)
+    led_planner = fmd_led.LedPlanner(flash_secs, args.frequency, clock)
+    event_tracker = None
+    if args.events:
+        event_tracker = fmd_events.ClientEventTracker(args.hysteresis, args.heartbeat, clock=clock)
+    coverage = None
+    if args.coverage or args.sitesurvey_mode:
+        coverage = fmd_coverage.CoverageAggregator()
+        # a report on demand is logged after the slot in progress
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: coverage.request_report())
+    history = None
+    if args.history:
+        history = fmd_history.RollingHistory(args.history, int(args.history_memory * 1024 * 1024), clock)
+    clients = {}
+    monitored = index_macs(macs_to_monitor, clients)
+    last_reload = clock()
+    # bulk and pipeline modes poll every client in one slot per cycle, otherwise each MAC gets its own slot
+    if args.bulk or args.pipeline:
+        scheduler.add(None)
+    else:
+        scheduler.add_all(monitored)
+    # watched clients are refreshed in their own slot every watch_refresh seconds
+    client_index = None
+    if watching(args):
+        client_index = fmd_watch.ClientIndex()
+        wlans = {}
+        scheduler.add(WATCH_KEY)
+        scheduler.set_interval(WATCH_KEY, args.watch_refresh)
+    metrics = fmd_metrics.registry
+    profiler = fmd_profiler.profiler
+    if metrics is not None:
+        metrics.target_period.set(args.frequency)
+        metrics.add_collector(lambda registry: collect_monitor_metrics(registry, scheduler, led_planner))
+
+    while True:
+        slot = scheduler.next()
+        if slot is None:
+            break
+        key, lag = slot
+        logger.debug('Scheduler - Slot %s lag %.3fs', key, lag)
+        if metrics is not None:
+            slot_start = fmd_scheduler.monotonic()
+            metrics.slot_lag_seconds.observe(lag)
+        if profiler is not None:
+            profiler.start_cycle()
+        if key == WATCH_KEY:
+            watched = refresh_watch(net_connect, client_index, args, wlans)
+            current = set(monitored)
+            added = [mac for mac in watched if mac not in current]
+            watched = set(watched)
+            removed = [mac for mac in monitored if mac not in watched]
+            if added or removed:
+                logger.info('Watch - %s clients added, %s removed, %s monitored', len(added), len(removed), len(watched))
+            monitored = update_monitored(args, scheduler, clients, monitored, detail_cache, added, removed)
+            if profiler is not None:
+                profiler.end_cycle()
+            continue
+        formatted_time = fmd_tools.format_time(scheduler.remaining())
+        if key is None and args.bulk:
+            output = net_connect.send_command('show client summary')
+            summary = ProfileClientSummary(output).get_clients()
+            logger.debug('Bulk mode - %s clients found in summary', len(summary))
+            profiles = ((clients[macs],) + bulk_client_profile(net_connect, clients[macs], summary, detail_cache, args.detail_refresh, clock()) for macs in monitored)
+        elif key is None:
+            logger.debug('Pipeline - Querying %s clients', len(monitored))
+            profiles = ((a, client_details, False) for a, client_details in query_client_profiles(net_connect, [clients[macs] for macs in monitored]))
+        else:
+            profiles = [(clients[key], query_client_profile(net_connect, clients[key]), False)]
+
+        located = []
+        for a, client_details, cached in profiles:
+            macs = a.standard_mac()
+            #logger.debug('Processing %s', a.standard_mac())
+            samples += 1
+            if metrics is not None:
+                metrics.clients.inc(state='associated' if client_details['Status'] else 'unassociated')
+            if adaptive_policy is not None:
+                scheduler.set_interval(macs, adaptive_policy.update(macs, client_details))
+            # a cached detail is the last sample again, it is reported but not stored or counted twice
+            if not cached:
+                if sample_writer is not None:
+                    sample_writer.append(a.standard_mac(), client_details)
+                if location_engine is not None and client_details['Status']:
+                    located.append((a.standard_mac(), client_details))
+                if coverage is not None:
+                    coverage.update(client_details)
+                if history is not None:
+                    history.append(macs, client_details)
+                if rules_engine is not None:
+                    rules_engine.update(macs, client_details)
+                if inventory is not None:
+                    inventory.observe(client_details)
+            report_client(args, led_planner, formatted_time, a, client_details, max_waps, event_tracker, history, inventory)
+        led_planner.flush(net_connect)
+        if located:
+            report_locations(location_engine, formatted_time, located)
+        if event_tracker is not None:
+            event_tracker.heartbeat()
+        if metrics is not None:
+            metrics.slot_seconds.observe(fmd_scheduler.monotonic() - slot_start)
+        if profiler is not None:
+            profiler.end_cycle()
+        if coverage is not None and coverage.report_requested:
+            log_coverage_report(coverage.report())
+
+        # profiles.json is checked at most once a period, only new MACs are validated
+        if profile_store is not None and clock() - last_reload >= args.frequency:
+            last_reload = clock()
+            added, removed = profile_store.reload_if_changed()
+            monitored = update_monitored(args, scheduler, clients, monitored, detail_cache, added, removed)
+
+    if sample_writer is not None:
+        sample_writer.close()
+    if history is not None:
+        logger.debug('History - %s', history.stats())
+    return {
+        'samples': samples,
+        'scheduler': scheduler.stats(),
+        'led': led_planner.stats(),
+        'coverage': coverage.report() if coverage is not None else None,
+        'rules': rules_engine.stats() if rules_engine is not None else None,
+    }
+
+
+def collect_monitor_metrics(registry, scheduler, led_planner):
+    '''
+    copies scheduler and LED planner statistics into metric gauges when metrics are read
+    '''
+    for name, value in scheduler.stats().items():
+        registry.scheduler.set(value, stat=name)
+    for name, value in led_planner.stats().items():
+        registry.led.set(value, state=name)
+
+
+def collect_governor_metrics(registry, governor):
+    '''
+    returns a collector copying governor statistics and queue depth into metric gauges
+    '''
+    gauge = registry.gauge('fmd_governor', 'Command governor statistics by priority class')
+    depth = registry.gauge('fmd_governor_queue_depth', 'Commands waiting for a governor token')
+
+    def collect(registry):
+        for priority_class, stats in governor.stats().items():
+            for name, value in stats.items():
+                gauge.set(value, priority=priority_class, stat=name)
+        depth.set(governor.depth())
+    return collect
+
+
+def log_governor_stats(stats):
+    logger = logging.getLogger(__name__)
+    for priority_class in sorted(stats, key=lambda name: fmd_governor.PRIORITIES[name]):
+        counts = stats[priority_class]
+        logger.info('Governor - %s %s commands, %s delayed, %s deferred, wait avg %.3fs max %.3fs, max queue depth %s', priority_class, counts['commands'], counts['delayed'], counts['deferred'], counts['wait_avg'], counts['wait_max'], counts['max_depth'])
+
+
+def log_coverage_report(report):
+    logger = logging.getLogger(__name__)
+    logger.info('Coverage - %s samples, %s WAPs, %s SSIDs', report['samples'], len(report['waps']), len(report['ssids']))
+    for name in sorted(report['waps']):
+        wap = report['waps'][name]
+        logger.info('Coverage - WAP %s SS %s SNR %s neighbour SS %s', name, fmd_coverage.format_summary(wap['rssi']), fmd_coverage.format_summary(wap['snr']), fmd_coverage.format_summary(wap['neighbour_rssi']))
+    for name in sorted(report['ssids']):
+        ssid = report['ssids'][name]
+        logger.info('Coverage - SSID %s SS %s SNR %s', name, fmd_coverage.format_summary(ssid['rssi']), fmd_coverage.format_summary(ssid['snr']))
+
+
+def write_profile(run_profiler):
+    logger = logging.getLogger(__name__)
+    try:
+        profile_path, summary_path = run_profiler.write()
+    except (IOError, OSError) as err:
+        logger.error('Profiler - Failed writing profile %s', err)
+        return
+    for phase, stats in sorted(run_profiler.stats().items()):
+        logger.info('Profiler - %s %s calls %.3fs', phase, stats['calls'], stats['seconds'])
+    logger.info('Profiler - %s cycles profiled, written to %s and %s', run_profiler.cycles, profile_path, summary_path)
+
+
+def log_metrics_summary(registry):
+    logger = logging.getLogger(__name__)
+    for line in registry.summary():
+        logger.info('Metrics - %s', line)
+
+
+SUBCOMMANDS = ('query', 'locate', 'parse')
+
+
+def run_subcommand(subcommand, argv, store_dir):
+    '''
+    runs fmd subcommands, these work offline without a WLC
+    '''
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger(__name__)
+    try:
+        if subcommand == 'query':
+            fmd_store.query_main(argv, store_dir, lambda mac: ProfileMAC(mac).standard_mac())
+        elif subcommand == 'locate':
+            fmd_location.locate_main(argv, store_dir, lambda mac: ProfileMAC(mac).standard_mac())
+        elif subcommand == 'parse':
+            fmd_parse.parse_main(argv, store_dir, parse_client_profile, lambda mac: ProfileMAC(mac).standard_mac())
+    except (ValueError, RuntimeError, IOError, OSError) as err:
+        logger.error('%s', err)
+        sys.exit(1)
 
 
 def main():
     app_dir = '.fmd'
-    working_dir = fmd_tools.process_user_home_app_dir(app_dir)
+
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        working_dir = fmd_tools.process_user_home_app_dir(app_dir)
+        run_subcommand(sys.argv[1], sys.argv[2:], os.path.join(working_dir, 'samples'))
+        return
+
+    # --version, --help and argument errors exit here before any file system checks
     args = process_cli()
 
     logging = configure_logging(args)
     logger = logging.getLogger(__name__)
 
-    if args.mac == False and args.profile == False:
+    working_dir = fmd_tools.process_user_home_app_dir(app_dir)
+    store_dir = os.path.join(working_dir, 'samples')
+
+    if args.mac == False and args.profile == False and not args.daemon and not watching(args):
         logger.error('No MAC or profile defined, Exiting...')
         sys.exit(1)
+    if watching(args) and (args.mac or args.profile is not False):
+        logger.error('Watch selectors replace MACs and profiles, Exiting...')
+        sys.exit(1)
 
     # check write permissions
     profiles_json = 'profiles.json'
@@ -451,96 +1135,144 @@ def main():
         logger.error(str(err))
         sys.exit(1)
 
-    if args.mac:
-        macs_to_monitor = args.mac
-    elif args.profile is not False:
+    if args.log:
         try:
-            json_data = process_profiles(profiles_json)
-        except Exception, err:
-            logger.error(str(err))
+            fmd_logfile.attach(log_file, args.log_format, int(args.log_max_size * 1024 * 1024), args.log_rotate * 3600, args.log_backups, [LOG_WHITELIST] if args.debug else [])
+        except (IOError, OSError) as err:
+            logger.error('Log file failed %s', err)
             sys.exit(1)
+
+    profile_store = None
+    if args.daemon or watching(args):
+        macs_to_monitor = []
+    elif args.mac:
+        macs_to_monitor = args.mac
+    elif args.profile is not False:
+        logger.debug('JSON file %s', profiles_json)
         try:
-            macs_to_monitor = get_profile_macs(args.profile, json_data)
+            profile_store = fmd_profiles.ProfileStore(profiles_json, args.profile, lambda mac: ProfileMAC(mac).standard_mac())
         except Exception, err:
             logger.error(str(err))
             sys.exit(1)
+        macs_to_monitor = profile_store.macs()
+        logger.info('Profiles loaded from JSON successfully')
     else:
         logger.error('No profiles or MACs supplied exiting')
         sys.exit(1)
 
-    username = raw_input('Username: ')
-    password = getpass.getpass()
+    formatted_time = fmd_tools.format_time(args.minutes * 60)
 
-    duration = args.minutes * 60
-    flash_secs = args.frequency + 5
-    finish_time = time.clock() + duration
-    max_waps = args.max_waps - 1
-    wlc_ip = args.wireless_lan_controller
-    verbose = args.console_verbose
-    formatted_time = fmd_tools.format_time(finish_time - time.clock())
+    if args.replay:
+        replay_clock = fmd_capture.ReplayClock(args.replay_speed)
+        clock, sleep = replay_clock.clock, replay_clock.sleep
+    else:
+        clock, sleep = fmd_scheduler.monotonic, time.sleep
+
+    if args.metrics or args.metrics_port:
+        try:
+            fmd_metrics.enable(args.metrics_port)
+        except Exception as err:
+            logger.error('Metrics endpoint failed %s', err)
+            sys.exit(1)
+
+    rules_engine = None
+    if args.rules:
+        try:
+            rules_engine = fmd_rules.RulesEngine(fmd_rules.load_rules(args.rules), clock=clock)
+        except (ValueError, IOError) as err:
+            logger.error('%s', err)
+            sys.exit(1)
+
+    if args.profile_run:
+        fmd_profiler.enable(working_dir, args.profile_top)
 
     try:
-        a = ProfileServer(wlc_ip)
+        net_connect = open_session(args, sleep)
     except ValueError as err:
         logger.error('%s Skipping', err)
         sys.exit(1)
-    except Exception, err:
-        logger.error('%s Unknown error', err)
-        sys.exit(1)
-
-    wlc_ip = a.cleaned_domain()
-    conn_dict = {
-        'device_type': 'cisco_wlc_ssh',
-        'ip' : wlc_ip,
-        'username' : username,
-        'password' : password,
-        'verbose': verbose,
-    }
-
-    try:
-        net_connect = ConnectHandler(**conn_dict)
     except Exception, err:
         logger.error('%s', err)
         sys.exit(1)
-    finally:
-        del username, password, conn_dict
+    if fmd_profiler.profiler is not None:
+        net_connect = fmd_profiler.ProfiledSession(net_connect, fmd_profiler.profiler)
+    if fmd_metrics.registry is not None:
+        net_connect = fmd_metrics.InstrumentedSession(net_connect, fmd_metrics.registry)
+    governor = None
+    if args.rate > 0:
+        governor = fmd_governor.Governor(args.rate, args.burst)
+        net_connect = fmd_governor.GovernedSession(net_connect, governor)
+        if fmd_metrics.registry is not None:
+            fmd_metrics.registry.add_collector(collect_governor_metrics(fmd_metrics.registry, governor))
+
+    if args.daemon:
+        try:
+            fmd_daemon.serve(net_connect, args.daemon, args.cache_ttl)
+        except Exception as err:
+            logger.error('%s', err)
+            sys.exit(1)
+        finally:
+            net_connect.disconnect()
+            if governor is not None:
+                log_governor_stats(governor.stats())
+            if fmd_profiler.profiler is not None:
+                write_profile(fmd_profiler.profiler)
+            if fmd_metrics.registry is not None:
+                log_metrics_summary(fmd_metrics.registry)
+        return
+
+    sample_writer = None
+    if args.store:
+        sample_writer = fmd_store.SampleStore(store_dir).writer()
+    location_engine = None
+    if args.ap_locations:
+        try:
+            location_engine = fmd_location.LocationEngine(fmd_location.load_ap_locations(args.ap_locations), args.location_method)
+        except (ValueError, RuntimeError, IOError) as err:
+            logger.error('%s', err)
+            sys.exit(1)
+
+    inventory = None
+    if args.inventory:
+        # the background refresh shares the session with the polling loop
+        if not isinstance(net_connect, fmd_session.LockedSession):
+            net_connect = fmd_session.LockedSession(net_connect)
+        inventory = fmd_inventory.ApInventory(net_connect, args.inventory_ttl, clock)
+        try:
+            inventory.refresh()
+        except Exception as err:
+            logger.error('Inventory - Failed loading WAP inventory, LED targets are not checked %s', err)
+        # a replay has no commands in the capture at background refresh times
+        if not args.replay:
+            inventory.start()
 
     logger.debug('Duration %s', formatted_time)
-    while time.clock() < finish_time:
-        formatted_time = fmd_tools.format_time(finish_time - time.clock())
-        for macs in macs_to_monitor:
-            try:
-                a = ProfileMAC(macs)
-            except Exception, err:
-                logger.error('%s Skipping', err)
-                continue
-            #logger.debug('Processing %s', a.standard_mac())
-            cli_cmd = 'show client detail %s' % a.standard_mac()
-            output = net_connect.send_command(cli_cmd)
-
-            b = ProfileWifiClient(output)
-            client_details = b.get_client_profile()
-
-            if args.debug:
-                format_profile(client_details)
-
-            if client_details['Status']:
-                # if device has just connected and some values are still unknown
-                # or being connected for some time and has neighbours
-                if client_details['Signal'] == 'Unknown' or len(client_details['WAP_Neighbours']) >= 1:
-                    logger.info('%s User %s MAC %s WAP %s SSID %s SS %s SNR %s', formatted_time, client_details['Username'], client_details['Client_MAC'], client_details['WAP_Name'], client_details['SSID'], client_details['Signal'], client_details['SNR'])
-                    if args.sitesurvey_mode:
-                        site_survey_mode(net_connect, client_details, flash_secs)
-                    elif args.disco_mode:
-                        disco_mode(net_connect, client_details, flash_secs, max_waps)
-                # else the device has not spoken to WLC in more than 60 seconds it means it has disappeared
-                # and WLC will hang on to association for another 5 minutes
-                else:
-                    logger.info('%s User %s MAC %s WAP %s SSID %s - timeout greater than 60 seconds', formatted_time, client_details['Username'], client_details['Client_MAC'], client_details['WAP_Name'], client_details['SSID'])
-            else:
-                logger.info('%s Client with MAC %s is not associated with WLC', formatted_time, a.standard_mac())
-        time.sleep(args.frequency)
+    stats = run_monitor(args, net_connect, macs_to_monitor, clock, sleep, sample_writer, location_engine, profile_store, rules_engine, inventory)
+    if inventory is not None:
+        inventory.stop()
+    net_connect.disconnect()
+
+    logger.info('Scheduler - %s samples, %s overruns, %s slots skipped, %s deferred, lag avg %.3fs max %.3fs', stats['scheduler']['samples'], stats['scheduler']['overruns'], stats['scheduler']['skipped'], stats['scheduler']['deferred'], stats['scheduler']['avg_lag'], stats['scheduler']['max_lag'])
+    if args.sitesurvey_mode or args.disco_mode:
+        logger.info('LED planner - %s commands sent, %s commands saved, %s deferred', stats['led']['sent'], stats['led']['saved'], stats['led']['deferred'])
+    if stats['coverage'] is not None:
+        log_coverage_report(stats['coverage'])
+    if inventory is not None:
+        inventory_stats = inventory.stats()
+        logger.info('Inventory - %s WAPs, %s down, %s refreshes, %s failed, %s LED targets skipped, RF graph %s WAPs %s edges', inventory_stats['waps'], inventory_stats['down'], inventory_stats['refreshes'], inventory_stats['failures'], inventory_stats['skipped'], inventory_stats['graph_waps'], inventory_stats['graph_edges'])
+    if stats['rules'] is not None:
+        logger.info('Rules - %s rules, %s distinct conditions, %s samples from %s clients, %s events', stats['rules']['rules'], stats['rules']['conditions'], stats['rules']['samples'], stats['rules']['clients'], stats['rules']['events'])
+    if governor is not None:
+        log_governor_stats(governor.stats())
+    if fmd_profiler.profiler is not None:
+        write_profile(fmd_profiler.profiler)
+    if fmd_metrics.registry is not None:
+        log_metrics_summary(fmd_metrics.registry)
 
 
 if __name__ == '__main__':
+    # fmd parse worker processes of a frozen exe run this module again, they must not run main
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
\ No newline at end of file
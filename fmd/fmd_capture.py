@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+records WLC sessions to an append-only capture file and replays them without a WLC
+
+capture file layout, all integers little endian
+    header  CAPTURE_MAGIC
+    record  RECORD_HEADER (time sent, round trip secs, command length, response length)
+            command utf-8
+            response utf-8
+"""
+import os
+import mmap
+import time
+import struct
+import logging
+
+import fmd_scheduler
+from fmd_session import SessionWrapper, send_commands
+
+CAPTURE_MAGIC = b'FMDCAP1\n'
+RECORD_HEADER = struct.Struct('<ddII')
+
+
+class CaptureSession(SessionWrapper):
+    '''
+    passes commands through to the wrapped session and appends each command and response to capture_file
+    '''
+
+    def __init__(self, session, capture_file):
+        super(CaptureSession, self).__init__(session)
+        new_file = not os.path.isfile(capture_file) or os.path.getsize(capture_file) == 0
+        if not new_file:
+            with open(capture_file, 'rb') as f:
+                if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+                    raise RuntimeError('Capture file %s is not a fmd capture' % capture_file)
+        self._file = open(capture_file, 'ab')
+        if new_file:
+            self._file.write(CAPTURE_MAGIC)
+        self.records = 0
+
+    def send_command(self, command, *args, **kwargs):
+        sent = time.time()
+        start = fmd_scheduler.monotonic()
+        output = self._session.send_command(command, *args, **kwargs)
+        self.record(command, output, sent, fmd_scheduler.monotonic() - start)
+        return output
+
+    def send_commands(self, commands):
+        # pipelined outputs are recorded as they arrive, round trip is the time since the previous output
+        commands = list(commands)
+        sent = time.time()
+        start = fmd_scheduler.monotonic()
+        for index, output in enumerate(send_commands(self._session, commands)):
+            now = fmd_scheduler.monotonic()
+            self.record(commands[index], output, sent, now - start)
+            sent, start = time.time(), now
+            yield output
+
+    def record(self, command, output, sent, round_trip):
+        command = command.encode('utf-8')
+        output = output.encode('utf-8')
+        self._file.write(RECORD_HEADER.pack(sent, round_trip, len(command), len(output)))
+        self._file.write(command)
+        self._file.write(output)
+        self._file.flush()
+        self.records += 1
+
+    def disconnect(self):
+        self._file.close()
+        self._session.disconnect()
+
+
+class CaptureReader:
+    '''
+    memory maps a capture file and indexes its records by command, responses are only read when asked for
+
+    Raises:
+        RuntimeError: if the file is not a fmd capture
+    '''
+
+    def __init__(self, capture_file):
+        self._file = open(capture_file, 'rb')
+        if os.path.getsize(capture_file) < len(CAPTURE_MAGIC):
+            raise RuntimeError('Capture file %s is empty' % capture_file)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            raise RuntimeError('Capture file %s is not a fmd capture' % capture_file)
+
+        # offsets of each record and of each command's records, only headers and commands are read
+        self.offsets = []
+        self.commands = {}
+        offset = len(CAPTURE_MAGIC)
+        size = len(self._map)
+        while offset + RECORD_HEADER.size <= size:
+            sent, round_trip, cmd_len, out_len = RECORD_HEADER.unpack_from(self._map, offset)
+            end = offset + RECORD_HEADER.size + cmd_len + out_len
+            if end > size:
+                # partly written record at the end of a capture still being recorded
+                break
+            command = self._map[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + cmd_len].decode('utf-8')
+            self.commands.setdefault(command, []).append(offset)
+            self.offsets.append(offset)
+            offset = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read(self, offset):
+        '''
+        Returns:
+            (time sent, round trip secs, command, response) of the record at offset
+        '''
+        sent, round_trip, cmd_len, out_len = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        command = self._map[start:start + cmd_len].decode('utf-8')
+        output = self._map[start + cmd_len:start + cmd_len + out_len].decode('utf-8')
+        return sent, round_trip, command, output
+
+    def records(self):
+        for offset in self.offsets:
+            yield self.read(offset)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class ReplayClock:
+    '''
+    clock and sleep for replaying at speed times real time, speed 0 never sleeps and only
+    advances the clock by the time slept so a replay runs as fast as it can be processed
+    '''
+
+    def __init__(self, speed=1.0):
+        self._speed = speed
+        self._start = fmd_scheduler.monotonic()
+        self._slept = 0.0
+
+    def clock(self):
+        if self._speed:
+            return (fmd_scheduler.monotonic() - self._start) * self._speed
+        return self._slept
+
+    def sleep(self, secs):
+        if self._speed:
+            time.sleep(secs / self._speed)
+        else:
+            self._slept += secs
+
+
+class ReplaySession:
+    '''
+    stands in for a WLC session by answering each command with its next recorded response,
+    responses for a command are replayed in order and start again from the first once exhausted
+
+    Args:
+        sleep: waits out each recorded round trip time, normally ReplayClock.sleep
+    '''
+
+    def __init__(self, capture_file, sleep=time.sleep):
+        self._reader = CaptureReader(capture_file)
+        self._sleep = sleep
+        self._cursors = {}
+        self.misses = 0
+
+    def send_command(self, command, *args, **kwargs):
+        logger = logging.getLogger(__name__)
+        offsets = self._reader.commands.get(command)
+        if not offsets:
+            logger.debug('Replay - No recorded response for %s', command)
+            self.misses += 1
+            return ''
+        cursor = self._cursors.get(command, 0)
+        self._cursors[command] = (cursor + 1) % len(offsets)
+        sent, round_trip, command, output = self._reader.read(offsets[cursor])
+        self._sleep(round_trip)
+        return output
+
+    def disconnect(self):
+        self._reader.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+streaming per WAP and per SSID coverage statistics
+
+every sample updates fixed size statistics, count, Welford mean and variance, min, max and a
+1 dB histogram for quantiles, so memory depends on the number of WAPs and SSIDs seen and not on
+how long the survey runs
+"""
+import array
+import math
+
+import fmd_tools
+
+MIN_DBM = -128
+MAX_DBM = 127
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+class SignalStats(object):
+    '''
+    incremental statistics of integer dBm values
+    '''
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max', 'bins')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.bins = array.array('l', [0]) * (MAX_DBM - MIN_DBM + 1)
+
+    def add(self, value):
+        value = max(MIN_DBM, min(MAX_DBM, int(value)))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.bins[value - MIN_DBM] += 1
+
+    def quantile(self, q):
+        '''
+        smallest dBm value with at least q of the values at or below it
+        '''
+        if not self.count:
+            return None
+        target = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for index, count in enumerate(self.bins):
+            seen += count
+            if seen >= target:
+                return index + MIN_DBM
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        summary = {
+            'count': self.count,
+            'mean': round(self.mean, 1),
+            'stdev': round(math.sqrt(self.m2 / self.count), 1),
+            'min': self.min,
+            'max': self.max,
+        }
+        for q in QUANTILES:
+            summary['p%d' % (q * 100)] = self.quantile(q)
+        return summary
+
+
+class CoverageAggregator:
+    '''
+    coverage statistics of every WAP and SSID seen in client samples
+
+    per WAP the RSSI and SNR of associated clients and the RSSI clients hear it at as a
+    neighbour, per SSID the RSSI and SNR of associated clients
+    '''
+
+    def __init__(self):
+        self._waps = {}
+        self._ssids = {}
+        self.samples = 0
+        self.report_requested = False
+
+    def request_report(self):
+        self.report_requested = True
+
+    def update(self, client_details):
+        if not client_details['Status']:
+            return
+        self.samples += 1
+        rssi = fmd_tools.parse_signal(client_details['Signal'])
+        snr = fmd_tools.parse_signal(client_details['SNR'])
+        for stats in (self._stats(self._waps, client_details['WAP_Name']), self._stats(self._ssids, client_details['SSID'])):
+            if rssi is not None:
+                stats['rssi'].add(rssi)
+            if snr is not None:
+                stats['snr'].add(snr)
+        for wap, avg_sig, timeout in client_details['WAP_Neighbours']:
+            self._stats(self._waps, wap)['neighbour_rssi'].add(avg_sig)
+
+    def report(self):
+        '''
+        Returns:
+            dictionary of samples and per WAP and per SSID statistic summaries
+        '''
+        self.report_requested = False
+        return {
+            'samples': self.samples,
+            'waps': dict((name, dict((key, stats.summary()) for key, stats in waps.items())) for name, waps in self._waps.items()),
+            'ssids': dict((name, dict((key, stats.summary()) for key, stats in ssids.items())) for name, ssids in self._ssids.items()),
+        }
+
+    def _stats(self, table, name):
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = {'rssi': SignalStats(), 'snr': SignalStats()}
+            if table is self._waps:
+                stats['neighbour_rssi'] = SignalStats()
+        return stats
+
+
+def format_summary(summary):
+    '''
+    short console text for a SignalStats summary
+    '''
+    if not summary['count']:
+        return 'none'
+    return 'n %s avg %s min %s p10 %s p50 %s p90 %s max %s' % (summary['count'], summary['mean'], summary['min'], summary['p10'], summary['p50'], summary['p90'], summary['max'])
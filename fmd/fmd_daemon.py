@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+persistent fmd daemon that shares one authenticated WLC session among many watchers
+
+watchers attach over a local Unix socket and send commands as JSON lines,
+    request   {"command": "show client detail 00:11:22:33:44:55"}
+    response  {"output": "..."} or {"error": "..."}
+    request   {"stats": true}
+    response  {"stats": {...}}
+
+show commands are answered from a short TTL result cache shared by every watcher and identical
+queries in flight at the same time are only sent to the WLC once. Only the commands fmd itself
+sends are accepted, each must match one of them as a whole single line, anything else is answered
+with an error and never reaches the WLC. The socket is only accessible to the daemon's user
+"""
+import os
+import re
+import sys
+import json
+import signal
+import socket
+import logging
+import threading
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+import fmd_scheduler
+from fmd_session import LockedSession
+
+# a WAP name or username, no whitespace or control characters that could end the command
+NAME = r'[^\x00-\x20\x7f-\x9f]+'
+MAC = r'[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}'
+# commands watchers may send, client and WLAN queries, WAP inventory and LED flashes
+ALLOWED_COMMANDS = tuple(re.compile(pattern + r'\Z') for pattern in (
+    r'show client detail ' + MAC,
+    r'show client summary',
+    r'show client username ' + NAME,
+    r'show wlan summary',
+    r'show ap summary',
+    r'show advanced 802\.11[ab] summary',
+    r'config ap led-state flash \d+ ' + NAME,
+))
+rx_control = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
+
+class ResultCache:
+    '''
+    caches show command output for ttl seconds, concurrent requests for the same command wait for
+    the first request's result rather than querying the WLC again
+    '''
+
+    def __init__(self, session, ttl, clock=fmd_scheduler.monotonic):
+        # a governed session is already locked and queues threads by priority itself
+        self._session = session if isinstance(session, LockedSession) else LockedSession(session)
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._results = {}
+        self._in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.passthrough = 0
+        self.rejected = 0
+
+    def send_command(self, command):
+        '''
+        Raises:
+            ValueError: if command is not one fmd sends
+        '''
+        if rx_control.search(command) or not any(allowed.match(command) for allowed in ALLOWED_COMMANDS):
+            with self._lock:
+                self.rejected += 1
+            logging.getLogger(__name__).warning('Daemon - Rejected command %r', command)
+            raise ValueError('command not allowed %r' % command)
+        if not command.startswith('show'):
+            with self._lock:
+                self.passthrough += 1
+            return self._session.send_command(command)
+
+        with self._lock:
+            now = self._clock()
+            cached = self._results.get(command)
+            if cached is not None and now - cached[0] < self._ttl:
+                self.hits += 1
+                return cached[1]
+            waiting = self._in_flight.get(command)
+            if waiting is None:
+                self._in_flight[command] = threading.Event()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if waiting is not None:
+            waiting.wait()
+            with self._lock:
+                cached = self._results.get(command)
+            if cached is not None:
+                return cached[1]
+            # the first request failed, query the WLC for this one
+            return self._session.send_command(command)
+
+        try:
+            output = self._session.send_command(command)
+            with self._lock:
+                self._results[command] = self._clock(), output
+                self._expire()
+            return output
+        finally:
+            with self._lock:
+                self._in_flight.pop(command).set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'passthrough': self.passthrough,
+                'rejected': self.rejected,
+                'cached': len(self._results),
+            }
+
+    def _expire(self):
+        now = self._clock()
+        for command in [c for c, (fetched, output) in self._results.items() if now - fetched >= self._ttl]:
+            del self._results[command]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        logger = logging.getLogger(__name__)
+        cache = self.server.cache
+        logger.info('Daemon - Watcher attached, %s attached', self.server.count_watchers(1))
+        try:
+            for line in iter(self.rfile.readline, b''):
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    if request.get('stats'):
+                        stats = cache.stats()
+                        stats['watchers'] = self.server.count_watchers()
+                        response = {'stats': stats}
+                    else:
+                        response = {'output': cache.send_command(request['command'])}
+                except Exception as err:
+                    response = {'error': str(err)}
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                self.wfile.flush()
+        finally:
+            logger.info('Daemon - Watcher detached, %s attached', self.server.count_watchers(-1))
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, handler, cache):
+        # the socket is created owner only, watchers get the daemon's admin session
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path, handler)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_path, 0o600)
+        self.cache = cache
+        self._watchers = 0
+        self._watchers_lock = threading.Lock()
+
+    def count_watchers(self, change=0):
+        '''
+        Returns:
+            watchers attached after adding change
+        '''
+        with self._watchers_lock:
+            self._watchers += change
+            return self._watchers
+
+
+def serve(session, socket_path, ttl):
+    '''
+    serves session to watchers on socket_path until interrupted
+
+    Raises:
+        RuntimeError: if Unix sockets are not supported or socket_path is in use
+    '''
+    logger = logging.getLogger(__name__)
+    if not hasattr(socket, 'AF_UNIX'):
+        raise RuntimeError('Daemon mode needs Unix socket support')
+    if os.path.exists(socket_path):
+        try:
+            DaemonSession(socket_path).disconnect()
+        except socket.error:
+            os.remove(socket_path)
+        else:
+            raise RuntimeError('Daemon already running on %s' % socket_path)
+
+    server = _DaemonServer(socket_path, _RequestHandler, ResultCache(session, ttl))
+    logger.info('Daemon - Listening on %s, result cache TTL %ss', socket_path, ttl)
+    # stop cleanly when terminated as well as when interrupted
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        logger.info('Daemon - Stopped, result cache %s', server.cache.stats())
+
+
+class DaemonSession:
+    '''
+    WLC session served by a fmd daemon, used in place of ConnectHandler by watchers
+
+    Raises:
+        socket.error: if no daemon is listening on socket_path
+    '''
+
+    def __init__(self, socket_path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._file = self._sock.makefile('rwb')
+
+    def _request(self, request):
+        self._file.write((json.dumps(request) + '\n').encode('utf-8'))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise RuntimeError('Daemon closed the connection')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise RuntimeError('Daemon error %s' % response['error'])
+        return response
+
+    def send_command(self, command, *args, **kwargs):
+        return self._request({'command': command})['output']
+
+    def stats(self):
+        return self._request({'stats': True})['stats']
+
+    def disconnect(self):
+        self._file.close()
+        self._sock.close()
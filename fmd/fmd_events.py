@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+turns client samples into a JSON Lines stream of change events
+
+events are only written when a client associates, disassociates, roams, changes SSID, times out
+or its signal moves by more than the hysteresis, a compact heartbeat covers everything else
+"""
+import sys
+import json
+from datetime import datetime
+
+import fmd_scheduler
+import fmd_tools
+
+
+class ClientEventTracker:
+    '''
+    keeps the last known state of each client and writes events to stream when it changes
+
+    Args:
+        hysteresis: dB RSSI or SNR has to move from the last reported value before a signal event
+        heartbeat: seconds between heartbeat events, 0 disables heartbeats
+    '''
+
+    def __init__(self, hysteresis=6, heartbeat=300, stream=sys.stdout, clock=fmd_scheduler.monotonic):
+        self._hysteresis = hysteresis
+        self._heartbeat = heartbeat
+        self._stream = stream
+        self._clock = clock
+        self._clients = {}
+        self._last_heartbeat = clock()
+        self._samples = 0
+
+        self.events = 0
+
+    def update(self, mac, client_details):
+        '''
+        compares a client's new client_details with its last known state
+
+        Returns:
+            list of events written
+        '''
+        self._samples += 1
+        previous = self._clients.get(mac)
+        events = []
+
+        if not client_details['Status']:
+            if previous is not None and previous['associated']:
+                events.append(self._event('disassociated', mac, previous))
+            self._clients[mac] = {'associated': False}
+            return self._write(events)
+
+        state = {
+            'associated': True,
+            'username': client_details['Username'],
+            'wap': client_details['WAP_Name'],
+            'ssid': client_details['SSID'],
+            'rssi': fmd_tools.parse_signal(client_details['Signal']),
+            'snr': fmd_tools.parse_signal(client_details['SNR']),
+            'timeout': fmd_tools.client_timed_out(client_details),
+        }
+
+        if previous is None or not previous['associated']:
+            events.append(self._event('associated', mac, state))
+            state['reported_rssi'], state['reported_snr'] = state['rssi'], state['snr']
+        else:
+            if state['wap'] != previous['wap']:
+                events.append(self._event('roam', mac, state, previous_wap=previous['wap']))
+            if state['ssid'] != previous['ssid']:
+                events.append(self._event('ssid_change', mac, state, previous_ssid=previous['ssid']))
+            if state['timeout'] and not previous['timeout']:
+                events.append(self._event('timeout', mac, state))
+
+            state['reported_rssi'], state['reported_snr'] = previous['reported_rssi'], previous['reported_snr']
+            if self._moved(state['rssi'], previous['reported_rssi']) or self._moved(state['snr'], previous['reported_snr']):
+                events.append(self._event('signal', mac, state, previous_rssi=previous['reported_rssi'], previous_snr=previous['reported_snr']))
+            if events:
+                state['reported_rssi'], state['reported_snr'] = state['rssi'], state['snr']
+
+        self._clients[mac] = state
+        return self._write(events)
+
+    def heartbeat(self):
+        '''
+        writes a heartbeat event when one is due
+
+        Returns:
+            list of events written
+        '''
+        now = self._clock()
+        if not self._heartbeat or now - self._last_heartbeat < self._heartbeat:
+            return []
+        self._last_heartbeat = now
+        event = {
+            'time': datetime.now().isoformat(),
+            'event': 'heartbeat',
+            'clients': len(self._clients),
+            'associated': sum(1 for state in self._clients.values() if state['associated']),
+            'samples': self._samples,
+        }
+        self._samples = 0
+        return self._write([event])
+
+    def _moved(self, value, reported):
+        if value is None or reported is None:
+            return value != reported
+        return abs(value - reported) >= self._hysteresis
+
+    def _event(self, name, mac, state, **extra):
+        event = {
+            'time': datetime.now().isoformat(),
+            'event': name,
+            'mac': mac,
+        }
+        for key in ('username', 'wap', 'ssid', 'rssi', 'snr'):
+            if key in state:
+                event[key] = state[key]
+        event.update(extra)
+        return event
+
+    def _write(self, events):
+        for event in events:
+            self._stream.write(json.dumps(event, sort_keys=True) + '\n')
+        if events:
+            self._stream.flush()
+            self.events += len(events)
+        return events
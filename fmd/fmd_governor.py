@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+token bucket command governor for WLC sessions
+
+every command takes a token, tokens refill at rate per second up to burst. Commands waiting for a
+token are queued by priority class, association queries first, then LED flash commands and last
+WAP inventory refreshes, so a busy session slows down the least important commands first and
+sampling degrades to a lower rate instead of loading the WLC's CPU. The polling loop sends LED
+flashes with try_acquire, they only take tokens queries have left spare and are deferred to the
+next flush otherwise, so a busy polling loop keeps its query rate and flashes LEDs with what is left
+"""
+import heapq
+import itertools
+import threading
+
+import fmd_scheduler
+from fmd_session import LockedSession, send_commands
+
+# lower numbers are sent first
+PRIORITIES = {
+    'query': 0,
+    'led': 1,
+    'inventory': 2,
+}
+
+
+def command_class(command):
+    if command.startswith('config ap led-state'):
+        return 'led'
+    if command.startswith('show ap summary') or command.startswith('show advanced'):
+        return 'inventory'
+    return 'query'
+
+
+class TokenBucket:
+    '''
+    rate tokens per second up to burst tokens, starts full
+    '''
+
+    def __init__(self, rate, burst, clock=fmd_scheduler.monotonic):
+        self._rate = float(rate)
+        self._burst = max(1.0, float(burst))
+        self._clock = clock
+        self._tokens = self._burst
+        self._updated = clock()
+
+    def take(self):
+        '''
+        takes a token if one is available
+
+        Returns:
+            0 when a token was taken, otherwise seconds until the next token
+        '''
+        now = self._clock()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self._rate
+
+
+class Governor:
+    '''
+    hands out tokens from a TokenBucket to threads in priority class order, first come first
+    served within a class
+    '''
+
+    def __init__(self, rate, burst, clock=fmd_scheduler.monotonic):
+        self._bucket = TokenBucket(rate, burst, clock)
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._stats = dict((name, {'commands': 0, 'delayed': 0, 'deferred': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'max_depth': 0}) for name in PRIORITIES)
+
+    def acquire(self, priority_class):
+        '''
+        blocks until a token is handed to priority_class
+
+        Returns:
+            seconds waited
+        '''
+        stats = self._stats[priority_class]
+        with self._cond:
+            start = self._clock()
+            ticket = (PRIORITIES[priority_class], next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            stats['max_depth'] = max(stats['max_depth'], sum(1 for waiting in self._waiting if waiting[0] == ticket[0]))
+            delayed = False
+            while True:
+                if self._waiting[0] == ticket:
+                    wait = self._bucket.take()
+                    if not wait:
+                        heapq.heappop(self._waiting)
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+                delayed = True
+            # the next ticket may already have a token
+            self._cond.notify_all()
+
+            waited = self._clock() - start if delayed else 0.0
+            stats['commands'] += 1
+            if delayed:
+                stats['delayed'] += 1
+                stats['wait_total'] += waited
+                stats['wait_max'] = max(stats['wait_max'], waited)
+            return waited
+
+    def try_acquire(self, priority_class):
+        '''
+        takes a token for priority_class only if one is spare now, no other command is waiting
+
+        Returns:
+            True when a token was taken
+        '''
+        stats = self._stats[priority_class]
+        with self._cond:
+            if self._waiting or self._bucket.take():
+                stats['deferred'] += 1
+                return False
+            stats['commands'] += 1
+            return True
+
+    def depth(self):
+        with self._cond:
+            return len(self._waiting)
+
+    def stats(self):
+        '''
+        Returns:
+            dictionary of per priority class commands, delayed commands, commands deferred by
+            try_acquire, wait avg and max seconds and maximum queue depth
+        '''
+        with self._cond:
+            stats = {}
+            for name, counts in self._stats.items():
+                stats[name] = dict(counts)
+                stats[name]['wait_avg'] = counts['wait_total'] / counts['delayed'] if counts['delayed'] else 0.0
+            return stats
+
+
+class GovernedSession(LockedSession):
+    '''
+    takes a token from governor before each command, the session is locked only while a command
+    is sent so threads queue on the governor in priority order
+    '''
+
+    def __init__(self, session, governor):
+        super(GovernedSession, self).__init__(session)
+        self.governor = governor
+
+    def send_command(self, command, *args, **kwargs):
+        self.governor.acquire(command_class(command))
+        return super(GovernedSession, self).send_command(command, *args, **kwargs)
+
+    def try_send_command(self, command, *args, **kwargs):
+        '''
+        sends command only if a token is spare now
+
+        Returns:
+            the output, None when no token was spare and the command was not sent
+        '''
+        if not self.governor.try_acquire(command_class(command)):
+            return None
+        return super(GovernedSession, self).send_command(command, *args, **kwargs)
+
+    def send_commands(self, commands):
+        # a pipelined session writes the next commands as outputs are read, so a token is taken
+        # before each output is read, the first batch goes out as a burst
+        commands = list(commands)
+        with self._lock:
+            outputs = iter(send_commands(self._session, commands))
+            for command in commands:
+                self.governor.acquire(command_class(command))
+                yield next(outputs)
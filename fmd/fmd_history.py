@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bounded rolling history of the last samples of each client
+
+each client has fixed size array ring buffers, WAP names and SSIDs are interned to ints and RSSI
+and SNR are kept as dBm shorts, so appending a sample allocates nothing. The number of clients
+is capped by memory, the least recently sampled client is dropped to make room for a new one
+"""
+import array
+import logging
+from collections import OrderedDict
+
+import fmd_tools
+
+NO_SIGNAL = -32768
+NOT_ASSOCIATED = -1
+# bytes per sample, ts double, ap and ssid ints, rssi, snr and neighbour count shorts
+RECORD_BYTES = 8 + 4 + 4 + 2 + 2 + 2
+
+
+class StringTable:
+    '''
+    interns strings to ints shared by every client history
+    '''
+
+    def __init__(self):
+        self._ids = {}
+        self.strings = []
+
+    def id(self, value):
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+
+class ClientHistory(object):
+    '''
+    ring buffers holding the last capacity samples of one client
+    '''
+    __slots__ = ('ts', 'ap', 'ssid', 'rssi', 'snr', 'neighbours', 'capacity', 'count', 'next')
+
+    def __init__(self, capacity):
+        self.ts = array.array('d', [0.0]) * capacity
+        self.ap = array.array('i', [NOT_ASSOCIATED]) * capacity
+        self.ssid = array.array('i', [NOT_ASSOCIATED]) * capacity
+        self.rssi = array.array('h', [NO_SIGNAL]) * capacity
+        self.snr = array.array('h', [NO_SIGNAL]) * capacity
+        self.neighbours = array.array('h', [0]) * capacity
+        self.capacity = capacity
+        self.count = 0
+        self.next = 0
+
+    def append(self, ts, ap, ssid, rssi, snr, neighbours):
+        i = self.next
+        self.ts[i] = ts
+        self.ap[i] = ap
+        self.ssid[i] = ssid
+        self.rssi[i] = rssi
+        self.snr[i] = snr
+        self.neighbours[i] = neighbours
+        self.next = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def indexes(self, window=None):
+        '''
+        ring positions of the last window samples, oldest first
+        '''
+        count = self.count if window is None else min(window, self.count)
+        start = self.next - count
+        return [(start + offset) % self.capacity for offset in range(count)]
+
+
+class RollingHistory:
+    '''
+    rolling history of every sampled client
+
+    Args:
+        capacity: samples kept per client
+        max_bytes: memory cap for all sample buffers
+    '''
+
+    def __init__(self, capacity, max_bytes, clock):
+        self._capacity = max(1, capacity)
+        self._max_clients = max(1, max_bytes // (self._capacity * RECORD_BYTES))
+        self._clock = clock
+        self._clients = OrderedDict()
+        self.strings = StringTable()
+
+        self.evicted = 0
+
+    def append(self, mac, client_details):
+        '''
+        adds a sample to a client's history, unassociated clients are kept as samples without a WAP
+        '''
+        history = self._clients.pop(mac, None)
+        if history is None:
+            if len(self._clients) >= self._max_clients:
+                self._clients.popitem(last=False)
+                self.evicted += 1
+            history = ClientHistory(self._capacity)
+        # most recently sampled clients are kept at the end
+        self._clients[mac] = history
+
+        if not client_details['Status']:
+            history.append(self._clock(), NOT_ASSOCIATED, NOT_ASSOCIATED, NO_SIGNAL, NO_SIGNAL, 0)
+            return
+        rssi = fmd_tools.parse_signal(client_details['Signal'])
+        snr = fmd_tools.parse_signal(client_details['SNR'])
+        history.append(self._clock(),
+            self.strings.id(client_details['WAP_Name']),
+            self.strings.id(client_details['SSID']),
+            NO_SIGNAL if rssi is None else rssi,
+            NO_SIGNAL if snr is None else snr,
+            min(len(client_details['WAP_Neighbours']), 32767))
+
+    def summary(self, mac, window=None):
+        '''
+        moving view over a client's last window samples
+
+        Returns:
+            dictionary of samples, associated samples, roams, and RSSI and SNR avg, min and max,
+            None when the client has no history
+        '''
+        history = self._clients.get(mac)
+        if history is None:
+            return None
+        indexes = history.indexes(window)
+        view = {'samples': len(indexes), 'associated': 0, 'roams': 0}
+        previous_ap = None
+        for i in indexes:
+            ap = history.ap[i]
+            if ap == NOT_ASSOCIATED:
+                continue
+            view['associated'] += 1
+            if previous_ap is not None and ap != previous_ap:
+                view['roams'] += 1
+            previous_ap = ap
+        for field in ('rssi', 'snr'):
+            column = getattr(history, field)
+            values = [column[i] for i in indexes if column[i] != NO_SIGNAL]
+            if values:
+                view[field + '_avg'] = float(sum(values)) / len(values)
+                view[field + '_min'] = min(values)
+                view[field + '_max'] = max(values)
+            else:
+                view[field + '_avg'] = view[field + '_min'] = view[field + '_max'] = None
+        return view
+
+    def waps(self, mac, window=None):
+        '''
+        WAP names of a client's last window samples, None where it was not associated
+        '''
+        history = self._clients.get(mac)
+        if history is None:
+            return []
+        return [self.strings.strings[history.ap[i]] if history.ap[i] != NOT_ASSOCIATED else None for i in history.indexes(window)]
+
+    def stats(self):
+        return {
+            'clients': len(self._clients),
+            'max_clients': self._max_clients,
+            'evicted': self.evicted,
+            'bytes': len(self._clients) * self._capacity * RECORD_BYTES,
+            'strings': len(self.strings.strings),
+        }
+
+
+def format_summary(view):
+    '''
+    short console text for a summary view
+    '''
+    if view is None or view['rssi_avg'] is None:
+        return ''
+    return 'avg %.0f min %s max %s dBm over %s samples, %s roams' % (view['rssi_avg'], view['rssi_min'], view['rssi_max'], view['samples'], view['roams'])
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cached WAP inventory and RF neighbour graph for LED targeting
+
+the inventory maps WAP names to MAC, model and status from show ap summary and the radio
+operational state in show advanced 802.11a/b summary. It is loaded at start-up and refreshed every
+ttl seconds from a background thread, so LED targeting is an in-memory lookup with no extra
+commands per cycle. WAPs not joined to the WLC are unknown and WAPs with every radio down are down.
+The RF neighbour graph is built from the neighbour WAPs clients report, at no cost in commands
+"""
+import re
+import logging
+import threading
+
+import fmd_scheduler
+
+AP_SUMMARY_COMMAND = 'show ap summary'
+RADIO_SUMMARY_COMMANDS = ('show advanced 802.11a summary', 'show advanced 802.11b summary')
+
+# AP Name   Slots  AP Model   Ethernet MAC   Location ...
+rx_ap_summary = re.compile(r"^(\S+)\s+\d+\s+(\S+)\s+([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s", re.MULTILINE)
+# AP Name   MAC Address   Slot   Admin   Oper   Channel   TxPower
+rx_radio_summary = re.compile(r"^(\S+)\s+[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}\s+\d+\s+(\S+)\s+(\S+)\s", re.MULTILINE)
+
+
+def parse_ap_summary(output):
+    '''
+    Returns:
+        dictionary of WAP name to dictionary of MAC and model
+    '''
+    return dict((match.group(1), {'mac': match.group(3).lower(), 'model': match.group(2)}) for match in rx_ap_summary.finditer(output))
+
+
+def parse_radio_summary(output):
+    '''
+    Returns:
+        list of (WAP name, radio up) for each radio
+    '''
+    return [(match.group(1), match.group(2).upper() == 'ENABLED' and match.group(3).upper() == 'UP') for match in rx_radio_summary.finditer(output)]
+
+
+class ApInventory:
+    '''
+    WAP inventory refreshed from a WLC session and an RF neighbour graph from client samples
+
+    Args:
+        session: shared with the polling loop, must be a LockedSession when the background refresh runs
+        ttl: seconds between background refreshes
+    '''
+
+    def __init__(self, session, ttl, clock=fmd_scheduler.monotonic):
+        self._session = session
+        self._ttl = ttl
+        self._clock = clock
+        self._stop = threading.Event()
+        self._thread = None
+        self._waps = {}
+        # associated WAP name to neighbour WAP name to [samples, mean RSSI]
+        self._graph = {}
+
+        self.loaded = False
+        self.refreshed = None
+        self.refreshes = 0
+        self.failures = 0
+        # LED targets dropped because their WAP is down or unknown, counted by the LED modes
+        self.skipped = 0
+
+    def refresh(self):
+        '''
+        reloads the inventory, the old inventory is swapped out in one assignment so readers
+        never see a partial refresh
+        '''
+        waps = parse_ap_summary(self._session.send_command(AP_SUMMARY_COMMAND))
+        for wap in waps.values():
+            wap['status'] = 'up'
+        radios = {}
+        for command in RADIO_SUMMARY_COMMANDS:
+            for name, up in parse_radio_summary(self._session.send_command(command)):
+                radios[name] = radios.get(name, False) or up
+        for name, up in radios.items():
+            if name in waps and not up:
+                waps[name]['status'] = 'down'
+        self._waps = waps
+        self.loaded = True
+        self.refreshed = self._clock()
+        self.refreshes += 1
+        logging.getLogger(__name__).debug('Inventory - %s WAPs, %s down', len(waps), sum(1 for wap in waps.values() if wap['status'] == 'down'))
+
+    def start(self):
+        '''
+        refreshes every ttl seconds from a daemon thread, a failed refresh keeps the last inventory
+        '''
+        self._thread = threading.Thread(target=self._run, name='fmd-inventory')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        '''
+        stops the background refresh, waiting up to timeout seconds for a refresh in progress
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while not self._stop.wait(self._ttl):
+            try:
+                self.refresh()
+            except Exception as err:
+                self.failures += 1
+                logger.warning('Inventory - Refresh failed, keeping inventory from %.0fs ago %s', self._clock() - self.refreshed if self.refreshed is not None else 0, err)
+
+    def get(self, name):
+        return self._waps.get(name)
+
+    def is_up(self, name):
+        '''
+        True when a WAP is joined with a radio up, or when no inventory has been loaded
+        '''
+        if not self.loaded:
+            return True
+        wap = self._waps.get(name)
+        return wap is not None and wap['status'] == 'up'
+
+    def observe(self, client_details):
+        '''
+        adds the neighbour WAPs an associated client hears to the RF neighbour graph
+        '''
+        if not client_details['Status']:
+            return
+        edges = self._graph.setdefault(client_details['WAP_Name'], {})
+        for wap, avg_sig, timeout in client_details['WAP_Neighbours']:
+            edge = edges.get(wap)
+            if edge is None:
+                edges[wap] = [1, float(avg_sig)]
+            else:
+                edge[0] += 1
+                edge[1] += (avg_sig - edge[1]) / edge[0]
+
+    def neighbours(self, name):
+        '''
+        Returns:
+            neighbour WAP names of a WAP, strongest first
+        '''
+        edges = self._graph.get(name, {})
+        return sorted(edges, key=lambda wap: edges[wap][1], reverse=True)
+
+    def stats(self):
+        waps = self._waps
+        return {
+            'waps': len(waps),
+            'down': sum(1 for wap in waps.values() if wap['status'] == 'down'),
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'graph_waps': len(self._graph),
+            'graph_edges': sum(len(edges) for edges in self._graph.values()),
+        }
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+plans WAP LED flash commands so each WAP is only sent a command when it needs one
+"""
+import logging
+
+import fmd_scheduler
+
+
+class LedPlanner:
+    '''
+    collects WAPs targeted by all monitored clients and tracks when each WAP's flash expires,
+    config ap led-state flash is only sent when a WAP is newly targeted or its flash will lapse
+    within lead_secs, normally the polling frequency. On a rate limited session a flash is only sent
+    with a spare token, otherwise it is deferred to the next flush so queries keep their rate
+    '''
+
+    def __init__(self, flash_secs, lead_secs, clock=fmd_scheduler.monotonic):
+        self._flash_secs = flash_secs
+        self._lead_secs = lead_secs
+        self._clock = clock
+        self._expiry = {}
+        self._targets = []
+        self._targeted = set()
+
+        self.sent = 0
+        self.saved = 0
+        self.deferred = 0
+
+    def target(self, wap):
+        '''
+        adds a WAP to flash on the next flush, repeat targets are coalesced
+        '''
+        if wap in self._targeted:
+            self.saved += 1
+            return
+        self._targeted.add(wap)
+        self._targets.append(wap)
+
+    def flush(self, net_connect):
+        '''
+        sends flash commands for targeted WAPs that are not already flashing long enough
+
+        Returns:
+            list of WAPs a command was sent to
+        '''
+        logger = logging.getLogger(__name__)
+        now = self._clock()
+        flashed = []
+        deferred = []
+        # a GovernedSession sends only with a spare token
+        try_send_command = getattr(net_connect, 'try_send_command', None)
+        for wap in self._targets:
+            expiry = self._expiry.get(wap)
+            if expiry is not None and expiry - now > self._lead_secs:
+                logger.debug('LED planner - %s already flashing for %.1fs', wap, expiry - now)
+                self.saved += 1
+                continue
+            cli_cmd = 'config ap led-state flash %s %s' % (self._flash_secs, wap)
+            if try_send_command is None:
+                output = net_connect.send_command(cli_cmd)
+            else:
+                output = try_send_command(cli_cmd)
+                if output is None:
+                    logger.debug('LED planner - No spare command token, deferring %s', wap)
+                    self.deferred += 1
+                    deferred.append(wap)
+                    continue
+            logger.debug('LED planner - Command sent to WLC %s', cli_cmd)
+            logger.debug('LED planner - WLC response %s', output)
+            self._expiry[wap] = now + self._flash_secs
+            self.sent += 1
+            flashed.append(wap)
+
+        # deferred WAPs are sent first on the next flush
+        self._targets = deferred
+        self._targeted = set(deferred)
+        # forget WAPs whose flash has lapsed
+        for wap in [w for w, expiry in self._expiry.items() if expiry <= now]:
+            del self._expiry[wap]
+        return flashed
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'saved': self.saved,
+            'deferred': self.deferred,
+        }
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+estimates client positions from neighbour WAP RSSI
+
+every neighbour observation of every sample in a batch is handled as one NumPy array, positions
+are a weighted centroid of the WAPs heard on the strongest WAP's floor, optionally refined by
+path loss trilateration
+
+WAP location files are JSON
+    {"AP-3F-12": {"x": 12.5, "y": 4.0, "floor": 3}, ...}
+or CSV with a header
+    name,x,y,floor
+"""
+import sys
+import csv
+import json
+import logging
+from argparse import ArgumentParser
+from datetime import datetime
+
+import fmd_store
+
+# numpy is imported by the first LocationEngine so fmd starts without it
+np = None
+
+METHODS = ('centroid', 'trilateration')
+
+
+def load_ap_locations(ap_file):
+    '''
+    Returns:
+        dictionary of WAP name to (x, y, floor)
+
+    Raises:
+        ValueError: if the file content is bad
+    '''
+    locations = {}
+    with open(ap_file, 'r') as f:
+        if ap_file.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            try:
+                rows = [dict(location, name=name) for name, location in json.load(f).items()]
+            except (ValueError, AttributeError, TypeError) as err:
+                raise ValueError('WAP locations JSON content bad %s' % err)
+        for row in rows:
+            try:
+                locations[row['name']] = float(row['x']), float(row['y']), int(row.get('floor') or 0)
+            except (KeyError, ValueError, TypeError) as err:
+                raise ValueError('WAP location bad %s %s' % (row, err))
+    return locations
+
+
+class LocationEngine:
+    '''
+    vectorised position estimation for batches of samples
+
+    Args:
+        tx_power: RSSI dBm one metre from a WAP
+        path_loss_exponent: 2 in free space, 3 to 4 indoors
+
+    Raises:
+        RuntimeError: if numpy is not installed
+    '''
+
+    def __init__(self, ap_locations, method='centroid', tx_power=-40.0, path_loss_exponent=3.0, iterations=10):
+        global np
+        if np is None:
+            try:
+                import numpy as np
+            except ImportError:
+                raise RuntimeError('Location estimation needs numpy, pip install numpy')
+        if method not in METHODS:
+            raise ValueError('Unknown location method %s' % method)
+        self.names = sorted(ap_locations)
+        self.ap_index = dict((name, index) for index, name in enumerate(self.names))
+        self._xy = np.array([ap_locations[name][:2] for name in self.names], dtype=float).reshape(-1, 2)
+        self._floor = np.array([ap_locations[name][2] for name in self.names], dtype=int)
+        self._method = method
+        self._tx_power = tx_power
+        self._exponent = path_loss_exponent
+        self._iterations = iterations
+
+    def ap_lookup(self, strings):
+        '''
+        returns an array mapping each string id of a string table to its WAP index, -1 when unknown
+        '''
+        return np.array([self.ap_index.get(value, -1) for value in strings], dtype=int)
+
+    def estimate_samples(self, samples):
+        '''
+        estimates positions for a list of neighbour lists, each [(wap name, rssi), ...]
+        '''
+        counts = np.array([len(neighbours) for neighbours in samples], dtype=int)
+        names = [wap for neighbours in samples for wap, rssi in neighbours]
+        rssi = np.array([rssi for neighbours in samples for wap, rssi in neighbours], dtype=float)
+        aps = np.array([self.ap_index.get(wap, -1) for wap in names], dtype=int)
+        sample_index = np.repeat(np.arange(len(samples)), counts)
+        return self.estimate(sample_index, aps, rssi, len(samples))
+
+    def estimate(self, sample_index, aps, rssi, samples):
+        '''
+        estimates positions from flat observation arrays, observation i is sample sample_index[i]
+        hearing WAP index aps[i] at rssi[i] dBm
+
+        Returns:
+            x, y, floor and number of WAPs used arrays with one entry per sample, x and y are NaN
+            for samples without a known WAP
+        '''
+        known = aps >= 0
+        sample_index, aps, rssi = sample_index[known], aps[known], rssi[known]
+        x = np.full(samples, np.nan)
+        y = np.full(samples, np.nan)
+        floor = np.full(samples, -1, dtype=int)
+        used = np.zeros(samples, dtype=int)
+        if not len(aps):
+            return x, y, floor, used
+
+        # floor of the strongest WAP of each sample, observations on other floors are dropped
+        order = np.lexsort((-rssi, sample_index))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sample_index[order][1:] != sample_index[order][:-1]
+        strongest = order[first]
+        floor[sample_index[strongest]] = self._floor[aps[strongest]]
+        same_floor = self._floor[aps] == floor[sample_index]
+        sample_index, aps, rssi = sample_index[same_floor], aps[same_floor], rssi[same_floor]
+
+        distance = 10 ** ((self._tx_power - rssi) / (10.0 * self._exponent))
+        weight = 1.0 / np.maximum(distance, 0.1) ** 2
+        ap_x, ap_y = self._xy[aps, 0], self._xy[aps, 1]
+
+        total = np.bincount(sample_index, weights=weight, minlength=samples)
+        used = np.bincount(sample_index, minlength=samples)
+        heard = total > 0
+        x[heard] = np.bincount(sample_index, weights=weight * ap_x, minlength=samples)[heard] / total[heard]
+        y[heard] = np.bincount(sample_index, weights=weight * ap_y, minlength=samples)[heard] / total[heard]
+
+        if self._method == 'trilateration':
+            x, y = self._trilaterate(x, y, sample_index, ap_x, ap_y, distance, weight, used >= 3)
+        return x, y, floor, used
+
+    def _trilaterate(self, x, y, sample_index, ap_x, ap_y, distance, weight, solvable):
+        # weighted Gauss-Newton on range residuals starting from the centroid, every sample's 2x2
+        # normal equations are summed with bincount and solved in closed form
+        samples = len(x)
+        x, y = x.copy(), y.copy()
+        for _ in range(self._iterations):
+            dx = x[sample_index] - ap_x
+            dy = y[sample_index] - ap_y
+            rng = np.maximum(np.hypot(dx, dy), 1e-6)
+            jx, jy = dx / rng, dy / rng
+            residual = rng - distance
+            a = np.bincount(sample_index, weights=weight * jx * jx, minlength=samples)
+            b = np.bincount(sample_index, weights=weight * jx * jy, minlength=samples)
+            c = np.bincount(sample_index, weights=weight * jy * jy, minlength=samples)
+            gx = np.bincount(sample_index, weights=weight * jx * residual, minlength=samples)
+            gy = np.bincount(sample_index, weights=weight * jy * residual, minlength=samples)
+            det = a * c - b * b
+            step = solvable & (np.abs(det) > 1e-9)
+            x[step] -= (c[step] * gx[step] - b[step] * gy[step]) / det[step]
+            y[step] -= (a[step] * gy[step] - b[step] * gx[step]) / det[step]
+        return x, y
+
+
+def locate_segment(engine, segment, mac=None, since=None, until=None):
+    '''
+    estimates positions for every sample of a store segment matching mac and the time range,
+    columns are read straight into NumPy arrays
+
+    Returns:
+        ts, mac string id, x, y, floor and WAPs used arrays
+    '''
+    rows = segment.index['rows']
+    ts = np.array(segment.column('ts'), dtype=float)
+    macs = np.array(segment.column('mac'), dtype=int)
+    nbr_start = np.array(segment.column('nbr_start'), dtype=int)
+    nbr_count = np.array(segment.column('nbr_count'), dtype=int)
+    nbr_ap = np.array(segment.column('nbr_ap'), dtype=int)
+    nbr_rssi = np.array(segment.column('nbr_rssi'), dtype=float)
+
+    selected = np.ones(rows, dtype=bool)
+    if mac is not None:
+        selected &= macs == segment.string_ids.get(mac, -1)
+    if since is not None:
+        selected &= ts >= since
+    if until is not None:
+        selected &= ts <= until
+    rows_selected = np.nonzero(selected)[0]
+
+    # flat index of every neighbour observation of the selected rows
+    counts = nbr_count[rows_selected]
+    sample_index = np.repeat(np.arange(len(rows_selected)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    observations = np.repeat(nbr_start[rows_selected], counts) + offsets
+    aps = engine.ap_lookup(segment.strings)[nbr_ap[observations]] if len(observations) else np.zeros(0, dtype=int)
+
+    x, y, floor, used = engine.estimate(sample_index, aps, nbr_rssi[observations], len(rows_selected))
+    return ts[rows_selected], macs[rows_selected], x, y, floor, used
+
+
+def process_locate_cli(argv):
+    parser = ArgumentParser(prog='fmd locate',
+        description='Estimates client positions from samples recorded with fmd --store')
+    parser.add_argument('-al', '--ap-locations',
+        required=True,
+        help='WAP locations JSON or CSV file')
+    parser.add_argument('-mac', '--mac',
+        help='Client MAC address, default = all clients')
+    parser.add_argument('-s', '--since',
+        type=fmd_store.parse_time,
+        metavar=('{YYYY-MM-DD HH:MM:SS}'),
+        help='Only samples at or after this time')
+    parser.add_argument('-u', '--until',
+        type=fmd_store.parse_time,
+        metavar=('{YYYY-MM-DD HH:MM:SS}'),
+        help='Only samples at or before this time')
+    parser.add_argument('--method',
+        default='centroid',
+        choices=METHODS,
+        help='Weighted centroid or path loss trilateration, default = centroid')
+    parser.add_argument('-j', '--json',
+        action="store_true",
+        help='Output positions as JSON Lines')
+    return parser.parse_args(argv)
+
+
+def locate_main(argv, store_dir, standard_mac):
+    '''
+    fmd locate subcommand, writes estimated positions of stored samples to stdout
+    '''
+    logger = logging.getLogger(__name__)
+    args = process_locate_cli(argv)
+    engine = LocationEngine(load_ap_locations(args.ap_locations), args.method)
+    mac = standard_mac(args.mac) if args.mac else None
+
+    count = 0
+    store = fmd_store.SampleStore(store_dir)
+    for segment_dir in store.segment_dirs():
+        segment = fmd_store.SegmentReader(segment_dir)
+        try:
+            index = segment.index
+            if not index['rows'] or (mac is not None and mac not in index['macs']):
+                continue
+            if (args.since is not None and index['max_ts'] < args.since) or (args.until is not None and index['min_ts'] > args.until):
+                continue
+            ts, macs, x, y, floor, used = locate_segment(engine, segment, mac, args.since, args.until)
+        finally:
+            segment.close()
+        for row in range(len(ts)):
+            if used[row] == 0:
+                continue
+            count += 1
+            if args.json:
+                sys.stdout.write(json.dumps({'ts': ts[row], 'mac': segment.strings[macs[row]], 'x': round(x[row], 2),
+                    'y': round(y[row], 2), 'floor': int(floor[row]), 'waps': int(used[row])}, sort_keys=True) + '\n')
+            else:
+                sys.stdout.write('%s MAC %s x %.1f y %.1f floor %s WAPs %s\n' % (
+                    datetime.fromtimestamp(ts[row]).strftime('%Y-%m-%d %H:%M:%S'),
+                    segment.strings[macs[row]], x[row], y[row], floor[row], used[row]))
+    logger.debug('Locate - %s positions estimated', count)
+    return count
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+log file writer that never blocks the polling loop
+
+records are formatted by the logging handler and queued, a background thread writes them to the
+log file in batches and rotates it by size and age, rotated segments are gzip compressed
+"""
+import os
+import gzip
+import json
+import time
+import atexit
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+FORMATS = ('text', 'json')
+BATCH_RECORDS = 500
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    formats records as JSON Lines
+    '''
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, sort_keys=True)
+
+
+class RotatingWriter:
+    '''
+    background thread writing queued lines to log_file
+
+    Args:
+        max_bytes: rotate when the file grows past this size, 0 disables
+        max_age: rotate when the file is older than this many seconds, 0 disables
+        backups: compressed segments kept, the oldest are removed
+    '''
+
+    def __init__(self, log_file, max_bytes, max_age, backups, queue_size=10000):
+        self._log_file = log_file
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._backups = backups
+        self._queue = queue.Queue(queue_size)
+        self._file = None
+        self._opened = None
+        self._size = 0
+        self._closed = False
+
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+
+        self._open()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, line):
+        '''
+        queues a line without waiting, lines are dropped and counted when the queue is full
+        '''
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        '''
+        writes everything queued and closes the file
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            # drain what else is queued so each batch is one write and one flush
+            while len(lines) < BATCH_RECORDS:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in lines
+            lines = [line for line in lines if line is not None]
+            if lines:
+                self._write(lines)
+            if stop:
+                if self.dropped:
+                    self._write(['%s log writer dropped %s records, queue full' % (datetime.now().isoformat(), self.dropped)])
+                self._file.close()
+                return
+
+    def _write(self, lines):
+        if self._due():
+            self._rotate()
+        data = b''.join((line if isinstance(line, bytes) else line.encode('utf-8')) + b'\n' for line in lines)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self.written += len(lines)
+
+    def _open(self):
+        self._file = open(self._log_file, 'ab')
+        self._size = self._file.tell()
+        self._opened = time.time()
+        if self._size:
+            self._opened = os.path.getmtime(self._log_file)
+
+    def _due(self):
+        if self._max_bytes and self._size >= self._max_bytes:
+            return True
+        return bool(self._max_age) and self._size > 0 and time.time() - self._opened >= self._max_age
+
+    def _rotate(self):
+        self._file.close()
+        segment = '%s.%s' % (self._log_file, datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+        os.rename(self._log_file, segment)
+        with open(segment, 'rb') as source:
+            with gzip.open(segment + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+        os.remove(segment)
+        self.rotations += 1
+        self._expire()
+        self._open()
+
+    def _expire(self):
+        directory, name = os.path.split(self._log_file)
+        segments = sorted(f for f in os.listdir(directory or '.') if f.startswith(name + '.') and f.endswith('.gz'))
+        for segment in segments[:max(0, len(segments) - self._backups)]:
+            os.remove(os.path.join(directory, segment))
+
+
+class QueueHandler(logging.Handler):
+    '''
+    formats records and hands them to a RotatingWriter
+    '''
+
+    def __init__(self, writer):
+        logging.Handler.__init__(self)
+        self._writer = writer
+
+    def emit(self, record):
+        try:
+            self._writer.put(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def attach(log_file, log_format='text', max_bytes=10 * 1024 * 1024, max_age=86400, backups=7, filters=()):
+    '''
+    adds a background log file handler to the root logger, the file is completed on exit
+
+    Returns:
+        the RotatingWriter
+    '''
+    writer = RotatingWriter(log_file, max_bytes, max_age, backups)
+    handler = QueueHandler(writer)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)-5s] [%(name)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    for log_filter in filters:
+        handler.addFilter(log_filter)
+    logging.getLogger().addHandler(handler)
+    atexit.register(writer.close)
+    logging.getLogger(__name__).debug('Log file - Writing %s to %s', log_format, log_file)
+    return writer
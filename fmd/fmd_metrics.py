@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+hot path counters and latency histograms with an optional Prometheus text endpoint
+
+metrics are off unless enable() is called, instrumented code checks fmd_metrics.registry is not None
+so the disabled cost is one attribute lookup
+"""
+import bisect
+import logging
+import threading
+
+import fmd_scheduler
+from fmd_session import SessionWrapper, send_commands
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+registry = None
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+
+
+class Counter:
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help_text = help_text
+        self._lock = lock
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s counter' % self.name]
+        for key, value in self._items():
+            lines.append('%s%s %s' % (self.name, _labels(key), value))
+        return lines
+
+    def summary(self):
+        return ['%s%s %s' % (self.name, _labels(key), value) for key, value in self._items()]
+
+    def _items(self):
+        # copied under the lock, the metrics endpoint renders from its own thread
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Gauge(Counter):
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = Counter.render(self)
+        lines[1] = '# TYPE %s gauge' % self.name
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, lock, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self._lock = lock
+        self._buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = {'buckets': [0] * (len(self._buckets) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0}
+            counts['buckets'][index] += 1
+            counts['sum'] += value
+            counts['count'] += 1
+            counts['max'] = max(counts['max'], value)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        for key, counts in self._items():
+            cumulative = 0
+            for bound, count in zip(self._buckets + ('+Inf',), counts['buckets']):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (self.name, _labels(key + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _labels(key), counts['sum']))
+            lines.append('%s_count%s %s' % (self.name, _labels(key), counts['count']))
+        return lines
+
+    def summary(self):
+        lines = []
+        for key, counts in self._items():
+            lines.append('%s%s count %s avg %.3fs max %.3fs' % (self.name, _labels(key), counts['count'],
+                counts['sum'] / counts['count'] if counts['count'] else 0.0, counts['max']))
+        return lines
+
+    def _items(self):
+        # copied under the lock so buckets, sum and count are from the same observations
+        with self._lock:
+            return sorted((key, dict(counts, buckets=list(counts['buckets']))) for key, counts in self._values.items())
+
+
+class Registry:
+    '''
+    holds metrics and collectors, collectors are called at render time to update gauges from
+    statistics kept elsewhere
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+        self.commands = self.counter('fmd_commands_total', 'WLC commands sent')
+        self.command_seconds = self.histogram('fmd_command_seconds', 'WLC command round trip time')
+        self.parse_seconds = self.histogram('fmd_parse_seconds', 'show client detail parse time')
+        self.slot_seconds = self.histogram('fmd_slot_seconds', 'Polling slot duration')
+        self.slot_lag_seconds = self.histogram('fmd_slot_lag_seconds', 'Polling slot start lag behind its deadline')
+        self.clients = self.counter('fmd_client_samples_total', 'Client samples by association state')
+        self.led_targets = self.counter('fmd_led_targets_total', 'WAPs targeted for LED flashing by mode')
+        self.scheduler = self.gauge('fmd_scheduler', 'Scheduler statistics')
+        self.led = self.gauge('fmd_led_commands', 'LED flash commands sent and saved')
+        self.target_period = self.gauge('fmd_target_period_seconds', 'Polling period each client should be sampled at')
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text, self._lock))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(name, help_text, self._lock))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, self._lock, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.summary())
+        return lines
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _collect(self):
+        for collector in self._collectors:
+            collector(self)
+
+
+def command_kind(command):
+    # label commands by their first three words so MACs and WAP names do not explode the label set
+    return ' '.join(command.split()[:3])
+
+
+class InstrumentedSession(SessionWrapper):
+    '''
+    counts and times every command sent through the wrapped session
+    '''
+
+    def __init__(self, session, registry):
+        super(InstrumentedSession, self).__init__(session)
+        self._registry = registry
+
+    def send_command(self, command, *args, **kwargs):
+        start = fmd_scheduler.monotonic()
+        output = self._session.send_command(command, *args, **kwargs)
+        kind = command_kind(command)
+        self._registry.command_seconds.observe(fmd_scheduler.monotonic() - start, command=kind)
+        self._registry.commands.inc(command=kind)
+        return output
+
+    def send_commands(self, commands):
+        # pipelined commands overlap, each is timed from the previous output
+        commands = list(commands)
+        start = fmd_scheduler.monotonic()
+        for index, output in enumerate(send_commands(self._session, commands)):
+            now = fmd_scheduler.monotonic()
+            kind = command_kind(commands[index])
+            self._registry.command_seconds.observe(now - start, command=kind)
+            self._registry.commands.inc(command=kind)
+            start = now
+            yield output
+
+
+def serve(registry, port, host='127.0.0.1'):
+    '''
+    serves registry at http://host:port/metrics from a daemon thread
+    '''
+    # the HTTP server modules are only imported when the endpoint is enabled
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug('Metrics - %s', format % args)
+
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logging.getLogger(__name__).info('Metrics - Serving http://%s:%s/metrics', host, port)
+    return server
+
+
+def enable(port=None, host='127.0.0.1'):
+    '''
+    turns metrics on and serves them at http://host:port/metrics when port is given
+
+    Returns:
+        the Registry
+    '''
+    global registry
+    registry = Registry()
+    if port:
+        serve(registry, port, host)
+    return registry
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+offline parser for large WLC output dumps
+
+the dump is read line by line and split into one record per client at each Client MAC Address
+line, records are parsed in chunks over a process pool and written as JSON Lines or into the
+sample store
+
+    fmd parse tech-support.txt -o clients.jsonl
+    fmd parse show-client-detail.txt --store --time "2026-10-18 09:00"
+"""
+import os
+import re
+import sys
+import json
+import logging
+from collections import deque
+from argparse import ArgumentParser
+
+import fmd_scheduler
+import fmd_store
+
+rx_record_start = re.compile(r"^\s*Client.MAC.Address\.+\s")
+# a prompt or the next command ends a record so the rest of a dump does not trail the last client
+rx_record_end = re.compile(r"^\s*(\(.*\)\s*[>#]|show\s)")
+
+WINDOW_PER_PROCESS = 4
+
+_parse_client = None
+
+
+def split_records(lines):
+    '''
+    generator yielding the text of each client record in lines, text before the first record is skipped
+    '''
+    record = None
+    for line in lines:
+        if rx_record_start.match(line):
+            if record:
+                yield ''.join(record)
+            record = [line]
+        elif record is not None:
+            if rx_record_end.match(line):
+                yield ''.join(record)
+                record = None
+            else:
+                record.append(line)
+    if record:
+        yield ''.join(record)
+
+
+def chunks(records, size):
+    '''
+    groups records into lists of size records
+    '''
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(parse_client):
+    global _parse_client
+    _parse_client = parse_client
+
+
+def _parse_chunk(chunk):
+    return [_parse_client(record) for record in chunk]
+
+
+def parse_records(records, parse_client, processes, chunk_size):
+    '''
+    parses records with parse_client over processes worker processes, in record order
+
+    Returns:
+        iterator of client_details
+    '''
+    if processes <= 1:
+        _init_worker(parse_client)
+        for chunk in chunks(records, chunk_size):
+            for client_details in _parse_chunk(chunk):
+                yield client_details
+        return
+
+    # Pool.imap reads its whole input up front, submitting chunks in a bounded window keeps
+    # memory flat however large the dump is
+    import multiprocessing
+    pool = multiprocessing.Pool(processes, _init_worker, (parse_client,))
+    in_flight = deque()
+    try:
+        for chunk in chunks(records, chunk_size):
+            in_flight.append(pool.apply_async(_parse_chunk, (chunk,)))
+            if len(in_flight) >= processes * WINDOW_PER_PROCESS:
+                for client_details in in_flight.popleft().get():
+                    yield client_details
+        while in_flight:
+            for client_details in in_flight.popleft().get():
+                yield client_details
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def process_parse_cli(argv):
+    # multiprocessing is only loaded by fmd parse, not by every fmd start
+    import multiprocessing
+    parser = ArgumentParser(prog='fmd parse',
+        description='Parses show client detail output from WLC dumps, - reads stdin')
+    parser.add_argument('dump',
+        help='WLC output dump file')
+    parser.add_argument('-o', '--output',
+        help='Write JSON Lines to this file, default = stdout')
+    parser.add_argument('-s', '--store',
+        action="store_true",
+        help='Store associated clients in the sample store instead of writing JSON Lines')
+    parser.add_argument('-t', '--time',
+        type=fmd_store.parse_time,
+        metavar=('{YYYY-MM-DD HH:MM:SS}'),
+        help='Sample time for --store, default = dump file modification time')
+    parser.add_argument('-j', '--processes',
+        default=multiprocessing.cpu_count(),
+        type=int,
+        help='Parser processes, default = %s' % multiprocessing.cpu_count())
+    parser.add_argument('--chunk',
+        default=256,
+        type=int,
+        help='Records sent to a parser process at a time, default = 256')
+    return parser.parse_args(argv)
+
+
+def parse_main(argv, store_dir, parse_client, standard_mac):
+    '''
+    fmd parse subcommand
+
+    Args:
+        parse_client: returns client_details for one client's show client detail output
+        standard_mac: converts a MAC to the standard format samples are stored with
+    '''
+    logger = logging.getLogger(__name__)
+    args = process_parse_cli(argv)
+    start = fmd_scheduler.monotonic()
+
+    dump = sys.stdin if args.dump == '-' else open(args.dump, 'r')
+    output = None
+    writer = None
+    if args.store:
+        writer = fmd_store.SampleStore(store_dir).writer()
+        ts = args.time
+        if ts is None:
+            ts = os.path.getmtime(args.dump) if args.dump != '-' else None
+    else:
+        output = open(args.output, 'w') if args.output else sys.stdout
+
+    records = 0
+    associated = 0
+    try:
+        for client_details in parse_records(split_records(dump), parse_client, args.processes, args.chunk):
+            records += 1
+            if not client_details['Status']:
+                continue
+            associated += 1
+            if writer is not None:
+                try:
+                    mac = standard_mac(client_details['Client_MAC'])
+                except ValueError as err:
+                    logger.error('%s Skipping', err)
+                    continue
+                writer.append(mac, client_details, ts)
+            else:
+                output.write(json.dumps(client_details, sort_keys=True) + '\n')
+    finally:
+        if writer is not None:
+            writer.close()
+        if output is not None and output is not sys.stdout:
+            output.close()
+        if dump is not sys.stdin:
+            dump.close()
+
+    elapsed = fmd_scheduler.monotonic() - start
+    logger.info('Parse - %s records, %s with client details in %.1fs, %.0f records/s', records, associated, elapsed, records / elapsed if elapsed else 0.0)
+    return records
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+pipelined command transport for netmiko cisco_wlc_ssh sessions
+
+netmiko's send_command finds the prompt and waits for it before every command, so each command
+costs several round trips. PipelinedSession writes up to depth commands into the channel back to
+back and splits the returning stream at each prompt, handing each command's output on as soon as
+its prompt arrives
+"""
+import time
+import logging
+from collections import deque
+
+import fmd_scheduler
+from fmd_session import SessionWrapper
+
+POLL_SECS = 0.01
+
+
+class PipelinedSession(SessionWrapper):
+    '''
+    adds send_commands to a netmiko session, send_command still uses netmiko
+
+    Args:
+        depth: commands in flight at once
+        timeout: seconds without any output before giving up
+    '''
+
+    def __init__(self, session, depth=10, timeout=30, clock=fmd_scheduler.monotonic, sleep=time.sleep):
+        super(PipelinedSession, self).__init__(session)
+        self._depth = max(1, depth)
+        self._timeout = timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._prompt = session.find_prompt()
+        logging.getLogger(__name__).debug('Pipeline - Prompt %s depth %s', self._prompt, self._depth)
+
+        self.batches = 0
+        self.commands = 0
+
+    def send_commands(self, commands):
+        '''
+        generator yielding each command's output in order
+
+        Raises:
+            IOError: if no output arrives for timeout seconds
+        '''
+        commands = list(commands)
+        self.batches += 1
+        self._session.clear_buffer()
+        pending = deque()
+        sent = 0
+        buf = ''
+        searched = 0
+        last_data = self._clock()
+        try:
+            while sent < len(commands) or pending:
+                while sent < len(commands) and len(pending) < self._depth:
+                    self._session.write_channel(commands[sent] + '\n')
+                    pending.append(commands[sent])
+                    sent += 1
+
+                data = self._session.read_channel()
+                if data:
+                    buf += data
+                    last_data = self._clock()
+                elif self._clock() - last_data > self._timeout:
+                    raise IOError('Pipeline - Prompt %s not seen in %ss, %s commands outstanding' % (self._prompt, self._timeout, len(pending)))
+                else:
+                    self._sleep(POLL_SECS)
+                    continue
+
+                # only search text not searched already, less the prompt length for split prompts
+                while pending:
+                    index = buf.find(self._prompt, searched)
+                    if index < 0:
+                        searched = max(0, len(buf) - len(self._prompt))
+                        break
+                    segment, buf, searched = buf[:index], buf[index + len(self._prompt):], 0
+                    self.commands += 1
+                    yield self._clean(pending.popleft(), segment)
+        except GeneratorExit:
+            # stopped early, read what is still in flight so the next command starts clean
+            self._drain(len(pending), buf)
+            raise
+
+    def _clean(self, command, segment):
+        if getattr(self._session, 'ansi_escape_codes', False):
+            segment = self._session.strip_ansi_escape_codes(segment)
+        lines = self._session.normalize_linefeeds(segment).split('\n')
+        # the first line is the echoed command and the last the start of the prompt line, as netmiko strips them
+        if lines and command.strip() in lines[0]:
+            lines = lines[1:]
+        if lines and not lines[-1].strip():
+            lines = lines[:-1]
+        return '\n'.join(lines)
+
+    def _drain(self, outstanding, buf):
+        last_data = self._clock()
+        while buf.count(self._prompt) < outstanding and self._clock() - last_data <= self._timeout:
+            data = self._session.read_channel()
+            if data:
+                buf += data
+                last_data = self._clock()
+            else:
+                self._sleep(POLL_SECS)
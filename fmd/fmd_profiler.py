@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+opt-in profiling of the polling loop
+
+each polling cycle runs under cProfile, and the time and memory growth in SSH waits, show client
+detail parsing, logging and LED commands are added up. Memory growth is the net change in memory
+traced by tracemalloc, or on Python 2 the growth of the process's peak RSS. At the end of the run
+a cProfile dump and a summary of phases and top hot spots are written
+
+profiling is off unless enable() is called, hooks check fmd_profiler.profiler is not None so the
+disabled cost is one attribute lookup
+"""
+import os
+import sys
+import time
+import logging
+
+import fmd_governor
+import fmd_scheduler
+from fmd_session import SessionWrapper, send_commands
+
+PHASES = ('ssh', 'parse', 'logging', 'led')
+TRACE_FRAMES = 1
+
+profiler = None
+# set by RunProfiler, tracemalloc is only in Python 3.4 and later, resource is POSIX only
+tracemalloc = None
+resource = None
+# ru_maxrss is in KiB, except on macOS where it is in bytes
+MAXRSS_BYTES = 1 if sys.platform == 'darwin' else 1024
+
+
+class RunProfiler:
+    '''
+    collects cProfile statistics over polling cycles and time and memory growth per phase
+
+    Args:
+        output_dir: directory the profile and summary are written to
+        top: hot spots listed in the summary
+    '''
+
+    def __init__(self, output_dir, top=20, clock=fmd_scheduler.monotonic):
+        # the profilers are only imported when profiling is turned on
+        global tracemalloc, resource
+        import cProfile
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+            try:
+                import resource
+            except ImportError:
+                resource = None
+
+        self._output_dir = output_dir
+        self._top = top
+        self._clock = clock
+        self._profile = cProfile.Profile()
+        self._cycle_start = None
+        self._phases = dict((phase, {'calls': 0, 'seconds': 0.0, 'memory': 0}) for phase in PHASES)
+        self._started = time.time()
+
+        self.cycles = 0
+        self.cycle_seconds = 0.0
+        self.cycle_max = 0.0
+
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+    def start_cycle(self):
+        self._cycle_start = self._clock()
+        self._profile.enable()
+
+    def end_cycle(self):
+        if self._cycle_start is None:
+            return
+        self._profile.disable()
+        elapsed = self._clock() - self._cycle_start
+        self._cycle_start = None
+        self.cycles += 1
+        self.cycle_seconds += elapsed
+        self.cycle_max = max(self.cycle_max, elapsed)
+
+    def mark(self):
+        '''
+        Returns:
+            the start of a phase for record
+        '''
+        return self._clock(), _memory()
+
+    def record(self, phase, mark):
+        '''
+        adds the time and memory growth since mark to phase, memory freed is not subtracted
+        '''
+        stats = self._phases[phase]
+        stats['calls'] += 1
+        stats['seconds'] += self._clock() - mark[0]
+        stats['memory'] += max(0, _memory() - mark[1])
+
+    def time_handler(self, handler):
+        '''
+        adds the time handler spends on each log record to the logging phase
+        '''
+        handle = handler.handle
+
+        def timed_handle(record):
+            mark = self.mark()
+            try:
+                return handle(record)
+            finally:
+                self.record('logging', mark)
+        handler.handle = timed_handle
+
+    def stats(self):
+        return dict((phase, dict(stats)) for phase, stats in self._phases.items())
+
+    def write(self):
+        '''
+        writes the cProfile dump and the summary to output_dir
+
+        Returns:
+            paths of the profile and the summary
+        '''
+        self.end_cycle()
+        name = os.path.join(self._output_dir, 'fmd-profile-%s' % time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started)))
+        profile_path = name + '.prof'
+        summary_path = name + '.txt'
+        self._profile.dump_stats(profile_path)
+
+        with open(summary_path, 'w') as summary:
+            summary.write('fmd profile %s\n\n' % time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started)))
+            summary.write('%s cycles, avg %.3fs max %.3fs\n\n' % (self.cycles, self.cycle_seconds / self.cycles if self.cycles else 0.0, self.cycle_max))
+            summary.write('%-8s %8s %10s %12s %20s\n' % ('phase', 'calls', 'seconds', 'per cycle', _memory_heading()))
+            for phase in PHASES:
+                stats = self._phases[phase]
+                summary.write('%-8s %8s %10.3f %12.4f %20s\n' % (phase, stats['calls'], stats['seconds'],
+                    stats['seconds'] / self.cycles if self.cycles else 0.0,
+                    '%.1f' % (stats['memory'] / 1024.0) if tracemalloc is not None or resource is not None else 'n/a'))
+            summary.write('\nphases can overlap, logging during another phase is counted in both\n')
+
+            summary.write('\ntop %s functions by own time\n' % self._top)
+            summary.flush()
+            if self.cycles:
+                import pstats
+                stats = pstats.Stats(self._profile, stream=summary)
+                stats.sort_stats('time').print_stats(self._top)
+
+            if tracemalloc is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                summary.write('\ntraced memory %.1f KiB, peak %.1f KiB, top %s allocation sites\n' % (current / 1024.0, peak / 1024.0, self._top))
+                for statistic in tracemalloc.take_snapshot().statistics('lineno')[:self._top]:
+                    summary.write('%s\n' % statistic)
+            elif resource is not None:
+                summary.write('\ntracemalloc not available, peak RSS %.1f KiB\n' % (_memory() / 1024.0))
+            else:
+                summary.write('\ntracemalloc and resource not available, memory not measured\n')
+        return profile_path, summary_path
+
+
+def _memory():
+    # bytes of traced memory, or of peak RSS without tracemalloc
+    if tracemalloc is not None:
+        return tracemalloc.get_traced_memory()[0]
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_BYTES
+    return 0
+
+
+def _memory_heading():
+    if tracemalloc is None and resource is not None:
+        return 'peak RSS growth KiB'
+    return 'net traced KiB'
+
+
+class ProfiledSession(SessionWrapper):
+    '''
+    adds the time spent waiting on the WLC to the ssh phase, LED flash commands to the led phase
+    '''
+
+    def __init__(self, session, run_profiler):
+        super(ProfiledSession, self).__init__(session)
+        self._profiler = run_profiler
+
+    def send_command(self, command, *args, **kwargs):
+        mark = self._profiler.mark()
+        try:
+            return self._session.send_command(command, *args, **kwargs)
+        finally:
+            self._profiler.record(_phase(command), mark)
+
+    def send_commands(self, commands):
+        # only time spent reading the next output is counted, not time the caller spends on each output
+        commands = list(commands)
+        outputs = iter(send_commands(self._session, commands))
+        for command in commands:
+            mark = self._profiler.mark()
+            try:
+                output = next(outputs)
+            finally:
+                self._profiler.record(_phase(command), mark)
+            yield output
+
+
+def _phase(command):
+    return 'led' if fmd_governor.command_class(command) == 'led' else 'ssh'
+
+
+def enable(output_dir, top=20):
+    '''
+    turns profiling on, handlers already on the root logger are timed
+
+    Returns:
+        the RunProfiler
+    '''
+    global profiler
+    profiler = RunProfiler(output_dir, top)
+    for handler in logging.getLogger().handlers:
+        profiler.time_handler(handler)
+    return profiler
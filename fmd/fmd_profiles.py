@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+indexed MAC address profiles that reload when profiles.json changes
+
+profiles.json
+    {"Activate_profile": "office", "profiles": {"office": {"macs": ["00:11:22:33:44:55", ...]}, ...}}
+
+several profiles are selected with a comma separated list of names, their MACs are merged,
+normalised and de-duplicated once per load and MACs already seen are not validated again
+"""
+import os
+import json
+import logging
+
+
+def profile_names(selection):
+    '''
+    splits a comma separated profile selection into a list of names
+    '''
+    return [name.strip() for name in selection.split(',') if name.strip()]
+
+
+class ProfileStore:
+    '''
+    validated index of the MACs of the selected profiles
+
+    Args:
+        selection: comma separated profile names, None uses the file's Activate_profile
+        normalise: callable returning a MAC's standard form, raising ValueError when invalid
+
+    Raises:
+        RuntimeError: if the file content is bad or the selected profiles have no MACs
+    '''
+
+    def __init__(self, profiles_json, selection, normalise):
+        self._profiles_json = profiles_json
+        self._selection = selection
+        self._normalise = normalise
+        self._normalised = {}
+        self._macs = []
+        self._mtime = None
+        self._load()
+
+    def macs(self):
+        '''
+        list of standard MACs in profile order
+        '''
+        return list(self._macs)
+
+    def reload_if_changed(self):
+        '''
+        reloads the index when the file's modification time changed, a bad file keeps the current index
+
+        Returns:
+            lists of MACs added and removed, both empty when nothing changed
+        '''
+        logger = logging.getLogger(__name__)
+        try:
+            if self._stat() == self._mtime:
+                return [], []
+        except OSError as err:
+            logger.error('Profiles - Reload failed %s', err)
+            return [], []
+
+        previous = self._macs
+        try:
+            self._load()
+        except (RuntimeError, IOError, OSError) as err:
+            logger.error('Profiles - Reload failed, keeping %s MACs, %s', len(previous), err)
+            return [], []
+        current = set(self._macs)
+        known = set(previous)
+        added = [mac for mac in self._macs if mac not in known]
+        removed = [mac for mac in previous if mac not in current]
+        logger.info('Profiles - Reloaded, %s MACs added, %s removed, %s monitored', len(added), len(removed), len(self._macs))
+        return added, removed
+
+    def _stat(self):
+        return os.stat(self._profiles_json).st_mtime
+
+    def _load(self):
+        logger = logging.getLogger(__name__)
+        mtime = self._stat()
+        with open(self._profiles_json, 'r') as f:
+            try:
+                json_data = json.load(f)
+                profiles = json_data['profiles']
+            except ValueError as err:
+                raise RuntimeError('JSON content bad %s' % err)
+            except (KeyError, TypeError) as err:
+                raise RuntimeError('JSON content bad, no profiles %s' % err)
+
+        if self._selection is not None:
+            names = profile_names(self._selection)
+        else:
+            names = profile_names(json_data.get('Activate_profile') or '')
+        logger.info('Profile chosen is %s', ', '.join(names))
+
+        macs = []
+        seen = set()
+        for name in names:
+            profile = profiles.get(name)
+            if profile is None:
+                raise RuntimeError('No profiles found matching name %s' % name)
+            for mac in profile.get('macs') or []:
+                standard_mac = self._validated(mac)
+                if standard_mac is not None and standard_mac not in seen:
+                    seen.add(standard_mac)
+                    macs.append(standard_mac)
+        if not macs:
+            raise RuntimeError('Profile has no MACs, found 0')
+
+        logger.debug('Profiles - %s has %s MACs', ', '.join(names), len(macs))
+        self._macs = macs
+        self._mtime = mtime
+
+    def _validated(self, mac):
+        # MACs are validated once, invalid MACs are remembered as None so they are only logged once
+        if mac not in self._normalised:
+            try:
+                self._normalised[mac] = self._normalise(mac)
+            except ValueError as err:
+                logging.getLogger(__name__).error('%s Skipping', err)
+                self._normalised[mac] = None
+        return self._normalised[mac]
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+alert rules evaluated against every client sample
+
+rules are compiled once into condition predicates, identical conditions shared by several rules
+are evaluated once per sample. Each client keeps a run length or a window of match times per rule,
+so a sample is checked in constant time without rescanning history. A rule matching writes a
+JSON Lines event, it is written again only after the rule has stopped matching
+
+    {"rules": [
+        {"name": "low snr", "when": {"snr": ["<", 15]}, "consecutive": 3},
+        {"name": "roaming", "when": {"roamed": ["==", true]}, "count": 6, "window": 120},
+        {"name": "guest ssid", "when": {"ssid": ["not in", ["Corp", "Voice"]]}, "severity": "warning"}
+    ]}
+"""
+import re
+import sys
+import json
+import array
+import numbers
+import operator
+from collections import deque
+from datetime import datetime
+
+import fmd_scheduler
+import fmd_tools
+
+try:
+    STRING_TYPES = basestring
+except NameError:
+    STRING_TYPES = str
+
+# fields of a sample rules can test, None when a client is not associated
+FIELDS = ('associated', 'username', 'wap', 'ssid', 'rssi', 'snr', 'neighbours', 'timeout', 'roamed')
+FIELD_KINDS = {
+    'associated': 'bool',
+    'username': 'string',
+    'wap': 'string',
+    'ssid': 'string',
+    'rssi': 'number',
+    'snr': 'number',
+    'neighbours': 'number',
+    'timeout': 'bool',
+    'roamed': 'bool',
+}
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'in': lambda value, values: value in values,
+    'not in': lambda value, values: value not in values,
+    'matches': lambda value, pattern: pattern.search(value) is not None,
+}
+# operators limited to one kind of field
+KIND_OPERATORS = {
+    '<': 'number',
+    '<=': 'number',
+    '>': 'number',
+    '>=': 'number',
+    'matches': 'string',
+}
+# copied from a rule into its events
+EVENT_KEYS = ('severity', 'message')
+RULE_KEYS = ('name', 'when', 'consecutive', 'count', 'window') + EVENT_KEYS
+
+
+def load_rules(rules_file):
+    '''
+    Returns:
+        list of rule dictionaries
+
+    Raises:
+        ValueError: if the file content is bad
+    '''
+    with open(rules_file, 'r') as f:
+        try:
+            rules = json.load(f)['rules']
+        except (ValueError, KeyError, TypeError) as err:
+            raise ValueError('Rules JSON content bad %s' % err)
+    if not isinstance(rules, list):
+        raise ValueError('Rules JSON content bad, rules is not a list')
+    return rules
+
+
+def compile_condition(field, test):
+    '''
+    Returns:
+        predicate taking a sample's fields dictionary
+
+    Raises:
+        ValueError: if the field, operator or value are bad
+    '''
+    if field not in FIELDS:
+        raise ValueError('unknown field %s, fields are %s' % (field, ', '.join(FIELDS)))
+    try:
+        op, value = test
+        compare = OPERATORS[op]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('bad test %s for %s, tests are [operator, value] with operators %s' % (test, field, ', '.join(sorted(OPERATORS))))
+    kind = FIELD_KINDS[field]
+    if KIND_OPERATORS.get(op, kind) != kind:
+        raise ValueError('%s is a %s field, %s needs a %s field' % (field, kind, op, KIND_OPERATORS[op]))
+    if op in ('in', 'not in'):
+        if not isinstance(value, list) or not all(_is_kind(item, kind) for item in value):
+            raise ValueError('%s %s needs a list of %s values' % (field, op, kind))
+        value = frozenset(value)
+    elif op == 'matches':
+        if not _is_kind(value, kind):
+            raise ValueError('%s %s needs a pattern string' % (field, op))
+        try:
+            value = re.compile(value)
+        except re.error as err:
+            raise ValueError('bad pattern %s for %s %s' % (value, field, err))
+    # unknown values can be tested with == and !=
+    elif not _is_kind(value, kind) and not (value is None and op in ('==', '!=')):
+        raise ValueError('%s %s needs a %s value' % (field, op, kind))
+
+    def predicate(fields):
+        sample = fields[field]
+        # unknown values only ever equal or differ, so unassociated clients do not match thresholds
+        if sample is None and op not in ('==', '!='):
+            return False
+        return compare(sample, value)
+    return predicate
+
+
+def _is_kind(value, kind):
+    if kind == 'bool':
+        return isinstance(value, bool)
+    if kind == 'string':
+        return isinstance(value, STRING_TYPES)
+    # bool is a number in Python
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+class Rule(object):
+    '''
+    a compiled rule, conditions are indexes into the engine's shared conditions
+    '''
+    __slots__ = ('name', 'conditions', 'consecutive', 'count', 'window', 'extra')
+
+    def __init__(self, name, conditions, consecutive, count, window, extra):
+        self.name = name
+        self.conditions = conditions
+        self.consecutive = consecutive
+        self.count = count
+        self.window = window
+        self.extra = extra
+
+
+class ClientRuleState(object):
+    '''
+    rolling state of every rule for one client
+    '''
+    __slots__ = ('wap', 'runs', 'active', 'hits')
+
+    def __init__(self, rule_count):
+        self.wap = None
+        self.runs = array.array('l', [0]) * rule_count
+        self.active = bytearray(rule_count)
+        # match times of windowed rules, created on a rule's first match
+        self.hits = {}
+
+
+class RulesEngine:
+    '''
+    evaluates compiled rules against each client sample and writes matches to stream
+
+    Raises:
+        ValueError: if a rule is bad
+    '''
+
+    def __init__(self, rules, stream=sys.stdout, clock=fmd_scheduler.monotonic):
+        self._stream = stream
+        self._clock = clock
+        self._conditions = []
+        self._rules = []
+        self._clients = {}
+
+        self.samples = 0
+        self.events = 0
+
+        shared = {}
+        for number, rule in enumerate(rules, 1):
+            try:
+                self._rules.append(self._compile(rule, shared))
+            except ValueError as err:
+                raise ValueError('Rule %s bad, %s' % (rule.get('name', number) if isinstance(rule, dict) else number, err))
+
+    def _compile(self, rule, shared):
+        if not isinstance(rule, dict):
+            raise ValueError('not a JSON object')
+        unknown = [key for key in rule if key not in RULE_KEYS]
+        if unknown:
+            raise ValueError('unknown keys %s' % ', '.join(sorted(unknown)))
+        if 'name' not in rule or not isinstance(rule.get('when'), dict) or not rule['when']:
+            raise ValueError('needs a name and a when object of field tests')
+
+        conditions = []
+        for field, test in sorted(rule['when'].items()):
+            # the same test in several rules is evaluated once per sample
+            key = (field, json.dumps(test, sort_keys=True))
+            index = shared.get(key)
+            if index is None:
+                index = shared[key] = len(self._conditions)
+                self._conditions.append(compile_condition(field, test))
+            conditions.append(index)
+
+        try:
+            consecutive = int(rule.get('consecutive', 1))
+            count = int(rule.get('count', 1))
+            window = float(rule.get('window', 0))
+        except (ValueError, TypeError) as err:
+            raise ValueError('consecutive, count and window must be numbers %s' % err)
+        if consecutive < 1 or count < 1 or window < 0:
+            raise ValueError('consecutive and count must be at least 1 and window at least 0')
+        if window and 'consecutive' in rule:
+            raise ValueError('consecutive and window cannot be combined')
+        if count > 1 and not window:
+            raise ValueError('count needs a window in seconds')
+        extra = dict((key, rule[key]) for key in EVENT_KEYS if key in rule)
+        return Rule(rule['name'], tuple(conditions), consecutive, count, window, extra)
+
+    def update(self, mac, client_details):
+        '''
+        evaluates every rule against a client's new sample
+
+        Returns:
+            list of events written
+        '''
+        self.samples += 1
+        state = self._clients.get(mac)
+        if state is None:
+            state = self._clients[mac] = ClientRuleState(len(self._rules))
+        fields = self._fields(state, client_details)
+        results = [condition(fields) for condition in self._conditions]
+        now = self._clock()
+        runs = state.runs
+        active = state.active
+
+        events = []
+        base = None
+        for index, rule in enumerate(self._rules):
+            matched = True
+            for condition in rule.conditions:
+                if not results[condition]:
+                    matched = False
+                    break
+
+            if rule.window:
+                hits = state.hits.get(index)
+                if matched:
+                    if hits is None:
+                        hits = state.hits[index] = deque(maxlen=rule.count)
+                    hits.append(now)
+                if hits:
+                    while hits and now - hits[0] > rule.window:
+                        hits.popleft()
+                firing = hits is not None and len(hits) >= rule.count
+            else:
+                runs[index] = min(runs[index] + 1, rule.consecutive) if matched else 0
+                firing = runs[index] >= rule.consecutive
+
+            if firing and not active[index]:
+                if base is None:
+                    base = self._event(mac, fields)
+                event = dict(base, rule=rule.name)
+                event.update(rule.extra)
+                events.append(event)
+            active[index] = firing
+        return self._write(events)
+
+    def stats(self):
+        return {
+            'rules': len(self._rules),
+            'conditions': len(self._conditions),
+            'clients': len(self._clients),
+            'samples': self.samples,
+            'events': self.events,
+        }
+
+    def _fields(self, state, client_details):
+        if not client_details['Status']:
+            state.wap = None
+            fields = dict((field, None) for field in FIELDS)
+            fields['associated'] = False
+            return fields
+        wap = client_details['WAP_Name']
+        fields = {
+            'associated': True,
+            'username': client_details['Username'],
+            'wap': wap,
+            'ssid': client_details['SSID'],
+            'rssi': fmd_tools.parse_signal(client_details['Signal']),
+            'snr': fmd_tools.parse_signal(client_details['SNR']),
+            'neighbours': len(client_details['WAP_Neighbours']),
+            'timeout': fmd_tools.client_timed_out(client_details),
+            'roamed': state.wap is not None and wap != state.wap,
+        }
+        state.wap = wap
+        return fields
+
+    def _event(self, mac, fields):
+        # shared by every rule a sample matches
+        event = {
+            'time': datetime.now().isoformat(),
+            'event': 'rule',
+            'mac': mac,
+        }
+        for key in ('username', 'wap', 'ssid', 'rssi', 'snr'):
+            if fields[key] is not None:
+                event[key] = fields[key]
+        return event
+
+    def _write(self, events):
+        for event in events:
+            self._stream.write(json.dumps(event, sort_keys=True) + '\n')
+        if events:
+            self._stream.flush()
+            self.events += len(events)
+        return events
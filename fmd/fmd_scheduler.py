@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+deadline based scheduler, gives each key a fixed rate polling slot
+"""
+import time
+import heapq
+import logging
+from collections import deque
+
+import fmd_tools
+
+# python 2 has no monotonic clock, fall back to wall clock time
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    monotonic = time.time
+
+
+class Scheduler:
+    '''
+    fixed rate scheduler, deadlines advance by period from the start time rather than from
+    when work finished so slow polls do not make the schedule drift
+
+    a slot that is late by a whole period or more is an overrun, the missed slots are skipped
+    and counted instead of being run back to back
+
+    keys can be given their own interval with set_interval, budget caps the slots run in any
+    period, slots over budget are deferred until the oldest slot in the period has aged out.
+    Slots deferred to the same time run most overdue first, measured in each key's own interval,
+    so clients on short adaptive intervals are not starved by slow ones that happened to pop first
+    '''
+
+    def __init__(self, period, duration, clock=monotonic, sleep=time.sleep, budget=None):
+        self._period = float(period)
+        self._budget = budget
+        self._intervals = {}
+        self._last_deadlines = {}
+        self._recent = deque()
+        self._clock = clock
+        self._sleep = sleep
+        self._start = clock()
+        self._finish_time = self._start + duration
+        self._heap = []
+        self._seq = 0
+        self._entries = {}
+        # original deadline of keys deferred by the budget
+        self._deferred = {}
+
+        self.samples = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    def period(self):
+        return self._period
+
+    def remaining(self):
+        return max(0.0, self._finish_time - self._clock())
+
+    def add(self, key, offset=0.0):
+        '''
+        schedules key with its first slot offset seconds from now
+        '''
+        self._push(self._clock() + offset, key)
+
+    def add_all(self, keys, stagger=True):
+        '''
+        schedules keys, spreading their slots evenly across the period when stagger is True
+        '''
+        keys = list(keys)
+        for index, key in enumerate(keys):
+            offset = self._period * index / len(keys) if stagger else 0.0
+            self.add(key, offset)
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+        self._deferred.pop(key, None)
+        self._intervals.pop(key, None)
+        self._last_deadlines.pop(key, None)
+
+    def set_interval(self, key, interval):
+        '''
+        sets the seconds between key's slots, its pending slot is moved to interval after its last slot
+        '''
+        self._intervals[key] = float(interval)
+        last = self._last_deadlines.get(key)
+        if last is not None and key in self._entries:
+            self._deferred.pop(key, None)
+            self._push(last + self._intervals[key], key)
+
+    def interval(self, key):
+        return self._intervals.get(key, self._period)
+
+    def keys(self):
+        return list(self._entries)
+
+    def next(self):
+        '''
+        waits for the next due slot
+
+        Returns:
+            (key, lag) where lag is seconds behind the slot deadline, None when duration has expired
+        '''
+        logger = logging.getLogger(__name__)
+        while self._heap:
+            deadline, rank, seq, key = heapq.heappop(self._heap)
+            # skip slots of removed or rescheduled keys
+            if self._entries.get(key) != seq:
+                continue
+            if deadline >= self._finish_time:
+                self._heap = []
+                self._entries = {}
+                break
+
+            now = self._clock()
+            if deadline > now:
+                self._sleep(deadline - now)
+                now = self._clock()
+            # slow polls can run past the finish, slots due before it are not run late
+            if now >= self._finish_time:
+                self._heap = []
+                self._entries = {}
+                break
+
+            if self._budget:
+                while self._recent and self._recent[0] + self._period <= now:
+                    self._recent.popleft()
+                if len(self._recent) >= self._budget:
+                    logger.debug('Scheduler - Budget of %s slots used, deferring %s', self._budget, key)
+                    self.deferred += 1
+                    original = self._deferred.setdefault(key, deadline)
+                    release = self._recent[0] + self._period
+                    self._push(release, key, -(release - original) / self.interval(key))
+                    continue
+                self._recent.append(now)
+                deadline = self._deferred.pop(key, deadline)
+
+            interval = self.interval(key)
+            lag = max(0.0, now - deadline)
+            missed = int(lag // interval)
+            if missed:
+                self.overruns += 1
+                self.skipped += missed
+                logger.debug('Scheduler - Overrun %s by %.3fs, skipping %s slots', key, lag, missed)
+            self._last_deadlines[key] = deadline + missed * interval
+            self._push(deadline + (missed + 1) * interval, key)
+
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            self.last_lag = lag
+            return key, lag
+        return None
+
+    def stats(self):
+        avg_lag = self.total_lag / self.samples if self.samples else 0.0
+        return {
+            'samples': self.samples,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'deferred': self.deferred,
+            'avg_lag': avg_lag,
+            'max_lag': self.max_lag,
+            'last_lag': self.last_lag,
+        }
+
+    def _push(self, deadline, key, rank=0.0):
+        # rank orders slots due at the same time, lower first
+        self._seq += 1
+        self._entries[key] = self._seq
+        heapq.heappush(self._heap, (deadline, rank, self._seq, key))
+
+
+class AdaptivePolicy:
+    '''
+    picks each client's polling interval from how much it has been changing, clients that roam,
+    flap or whose signal and neighbours move are polled every min_interval, stable and unassociated
+    clients back off towards max_interval
+
+    volatility is a moving average of per sample change scores between 0 and 1
+    '''
+
+    def __init__(self, min_interval, max_interval, backoff=1.5, threshold=0.3):
+        self._min_interval = float(min_interval)
+        self._max_interval = float(max(max_interval, min_interval))
+        self._backoff = backoff
+        self._threshold = threshold
+        self._clients = {}
+
+    def update(self, key, client_details):
+        '''
+        Returns:
+            seconds until key should next be polled
+        '''
+        previous = self._clients.get(key)
+        if client_details['Status']:
+            state = {
+                'wap': client_details['WAP_Name'],
+                'rssi': fmd_tools.parse_signal(client_details['Signal']),
+                'snr': fmd_tools.parse_signal(client_details['SNR']),
+                'neighbours': frozenset(wap for wap, avg_sig, timeout in client_details['WAP_Neighbours']),
+            }
+        else:
+            state = None
+
+        if previous is None:
+            volatility, interval = 1.0, self._min_interval
+        else:
+            volatility = 0.5 * previous['volatility'] + 0.5 * self._change(previous['state'], state)
+            if state is not None and volatility >= self._threshold:
+                interval = self._min_interval
+            else:
+                interval = min(previous['interval'] * self._backoff, self._max_interval)
+
+        self._clients[key] = {'state': state, 'volatility': volatility, 'interval': interval}
+        return interval
+
+    def volatility(self, key):
+        client = self._clients.get(key)
+        return client['volatility'] if client else None
+
+    def _change(self, old, new):
+        if old is None or new is None:
+            return 0.0 if old is new else 1.0
+        if old['wap'] != new['wap']:
+            return 1.0
+        change = 0.0
+        for name in ('rssi', 'snr'):
+            if old[name] is not None and new[name] is not None:
+                change = max(change, abs(old[name] - new[name]) / 10.0)
+        union = old['neighbours'] | new['neighbours']
+        if union:
+            change = max(change, 1.0 - len(old['neighbours'] & new['neighbours']) / float(len(union)))
+        return min(change, 1.0)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+building blocks for WLC sessions, anything with send_command and disconnect like netmiko's ConnectHandler
+"""
+import threading
+
+
+def send_commands(session, commands):
+    '''
+    sends several commands using the session's send_commands when it has one, one at a time otherwise
+
+    Returns:
+        iterable of outputs in command order
+    '''
+    pipelined = getattr(session, 'send_commands', None)
+    if pipelined is None:
+        return (session.send_command(command) for command in commands)
+    return pipelined(commands)
+
+
+class SessionWrapper(object):
+    '''
+    wraps a WLC session, passing send_command and any other attribute through to the wrapped session
+    '''
+
+    def __init__(self, session):
+        self._session = session
+
+    def send_command(self, command, *args, **kwargs):
+        return self._session.send_command(command, *args, **kwargs)
+
+    def send_commands(self, commands):
+        return send_commands(self._session, commands)
+
+    def disconnect(self):
+        self._session.disconnect()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class LockedSession(SessionWrapper):
+    '''
+    serialises commands from several threads onto one session
+    '''
+
+    def __init__(self, session):
+        super(LockedSession, self).__init__(session)
+        self._lock = threading.Lock()
+
+    def send_command(self, command, *args, **kwargs):
+        with self._lock:
+            return self._session.send_command(command, *args, **kwargs)
+
+    def send_commands(self, commands):
+        # the whole batch is read under the lock so other threads' commands cannot interleave
+        with self._lock:
+            return list(send_commands(self._session, commands))
+
+    def disconnect(self):
+        with self._lock:
+            self._session.disconnect()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+local simulated Cisco WLC for load testing fmd without a production controller
+
+the simulated WLC accepts any credentials over SSH, presents the WLC User/Password login that
+netmiko's cisco_wlc_ssh driver expects and answers with output from fmd_synth
+
+    python fmd_simwlc.py --port 2222 --clients 1000 --latency 0.2 --jitter 0.05 --roam 0.01
+"""
+import re
+import sys
+import time
+import random
+import socket
+import logging
+import threading
+from argparse import ArgumentParser
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import fmd_synth
+
+PROMPT = '(Cisco Controller) >'
+INCORRECT_USAGE = "Incorrect usage. Use the '?' or <TAB> key to list commands."
+
+
+class SimulatedWLC:
+    '''
+    client and WAP state of a simulated WLC, thread safe so several SSH sessions can share it
+
+    Args:
+        clients: number of clients, the first associated_ratio of them are associated
+        latency: seconds added to every command response
+        jitter: random +/- seconds added to latency
+        roam: chance a client roams to a neighbouring WAP each time it is queried
+        down_waps: the last down_waps WAPs have their radios down
+    '''
+
+    def __init__(self, clients=100, neighbours=5, waps=100, latency=0.0, jitter=0.0, roam=0.0,
+                 associated_ratio=0.9, seed=0, sleep=time.sleep, down_waps=0):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sleep = sleep
+        self._neighbours = neighbours
+        self._waps = waps
+        self.latency = latency
+        self.jitter = jitter
+        self.roam = roam
+        self.down_waps = frozenset(range(max(0, waps - down_waps), waps))
+
+        self.clients = {}
+        associated = int(clients * associated_ratio)
+        for client in fmd_synth.synthetic_clients(clients, neighbours, waps, seed):
+            client['associated'] = client['index'] < associated
+            self.clients[client['mac']] = client
+
+        self.commands = {}
+        self.led_flashes = {}
+
+    def macs(self):
+        '''
+        returns MACs of all simulated clients, associated and not
+        '''
+        return sorted(self.clients, key=lambda mac: self.clients[mac]['index'])
+
+    def respond(self, command):
+        '''
+        returns the WLC output for command after the simulated latency
+        '''
+        delay = self.latency + self._rng.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            self._sleep(delay)
+
+        words = command.split()
+        if not words:
+            return ''
+        with self._lock:
+            verb = ' '.join(words[:3])
+            self.commands[verb] = self.commands.get(verb, 0) + 1
+
+            if words[:3] == ['show', 'client', 'detail'] and len(words) == 4:
+                client = self.clients.get(words[3].lower())
+                if client is None or not client['associated']:
+                    return 'Client %s not found' % words[3]
+                self._maybe_roam(client)
+                return fmd_synth.client_detail(client)
+            if words[:3] == ['show', 'client', 'summary']:
+                associated = [c for c in self.clients.values() if c['associated']]
+                associated.sort(key=lambda c: c['index'])
+                return fmd_synth.client_summary(associated)
+            if words[:3] == ['show', 'client', 'username'] and len(words) == 4:
+                matches = [c for c in self.clients.values() if c['associated'] and c['username'] == words[3]]
+                matches.sort(key=lambda c: c['index'])
+                return fmd_synth.client_username(matches)
+            if words[:3] == ['show', 'ap', 'summary']:
+                return fmd_synth.ap_summary(self._waps)
+            if words[:2] == ['show', 'advanced'] and words[3:] == ['summary'] and words[2] in ('802.11a', '802.11b'):
+                return fmd_synth.radio_summary(self._waps, 1 if words[2] == '802.11a' else 0, self.down_waps)
+            if words[:3] == ['show', 'wlan', 'summary']:
+                return fmd_synth.wlan_summary()
+            if words[:4] == ['config', 'ap', 'led-state', 'flash'] and len(words) == 6:
+                self.led_flashes[words[5]] = self.led_flashes.get(words[5], 0) + 1
+                return ''
+            if words[:3] == ['config', 'paging', 'disable'] or words[:3] == ['config', 'paging', 'enable']:
+                return ''
+            return INCORRECT_USAGE
+
+    def stats(self):
+        with self._lock:
+            return {
+                'commands': dict(self.commands),
+                'led_flashes': sum(self.led_flashes.values()),
+                'led_waps': len(self.led_flashes),
+            }
+
+    def _maybe_roam(self, client):
+        if self.roam and self._rng.random() < self.roam:
+            roamed = fmd_synth.synthetic_client(client['index'], self._neighbours, self._waps, self._rng)
+            for key in ('wap_mac', 'wap_name', 'signal', 'snr', 'neighbours'):
+                client[key] = roamed[key]
+
+
+def _ssh_server_interface():
+    # paramiko is only needed when the SSH server is started
+    import paramiko
+
+    class WlcServerInterface(paramiko.ServerInterface):
+        '''
+        accepts any username and password and a single interactive shell
+        '''
+
+        def __init__(self):
+            self.shell_requested = threading.Event()
+
+        def check_channel_request(self, kind, chanid):
+            if kind == 'session':
+                return paramiko.OPEN_SUCCEEDED
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+        def get_allowed_auths(self, username):
+            return 'password,none'
+
+        def check_auth_none(self, username):
+            return paramiko.AUTH_SUCCESSFUL
+
+        def check_auth_password(self, username, password):
+            return paramiko.AUTH_SUCCESSFUL
+
+        def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+            return True
+
+        def check_channel_shell_request(self, channel):
+            self.shell_requested.set()
+            return True
+
+    return paramiko, WlcServerInterface
+
+
+class _DelayedSender:
+    '''
+    sends data on a channel delay seconds after it is queued without holding up the caller,
+    like a network link with that round trip time
+    '''
+
+    def __init__(self, channel, delay):
+        self._channel = channel
+        self._delay = delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def sendall(self, data):
+        self._queue.put((time.time() + self._delay, data))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._channel.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            due, data = item
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._channel.sendall(data)
+            except socket.error:
+                return
+
+
+class SimulatedWLCServer:
+    '''
+    SSH front end for a SimulatedWLC, each connection is served on its own thread
+
+    Args:
+        rtt: network round trip seconds, output is delayed without delaying the next command
+    '''
+
+    def __init__(self, wlc, host='127.0.0.1', port=0, host_key=None, rtt=0.0):
+        self.wlc = wlc
+        self.rtt = rtt
+        self._paramiko, self._interface = _ssh_server_interface()
+        if host_key:
+            self._host_key = self._paramiko.RSAKey(filename=host_key)
+        else:
+            self._host_key = self._paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(100)
+        self.host, self.port = self._sock.getsockname()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''
+        accepts connections on a background thread
+        '''
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        logger = logging.getLogger(__name__)
+        self._sock.settimeout(0.5)
+        while not self._stopped.is_set():
+            try:
+                conn, address = self._sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            logger.debug('Simulated WLC - Connection from %s', address)
+            worker = threading.Thread(target=self._serve_connection, args=(conn,))
+            worker.daemon = True
+            worker.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sock.close()
+
+    def _serve_connection(self, conn):
+        logger = logging.getLogger(__name__)
+        transport = self._paramiko.Transport(conn)
+        transport.add_server_key(self._host_key)
+        server = self._interface()
+        try:
+            transport.start_server(server=server)
+            channel = transport.accept(20)
+            if channel is None or not server.shell_requested.wait(10):
+                return
+            self._shell(channel)
+        except (EOFError, socket.error, self._paramiko.SSHException) as err:
+            logger.debug('Simulated WLC - Session closed %s', err)
+        finally:
+            transport.close()
+
+    def _shell(self, channel):
+        out = _DelayedSender(channel, self.rtt) if self.rtt else channel
+        out.sendall('\r\n(Cisco Controller)\r\nUser: ')
+        if self._read_line(channel, out, echo=True) is None:
+            return
+        out.sendall('Password:')
+        if self._read_line(channel, out, echo=False) is None:
+            return
+        out.sendall('\r\n' + PROMPT)
+        while True:
+            command = self._read_line(channel, out, echo=True)
+            if command is None or command.strip() in ('logout', 'exit'):
+                break
+            output = self.wlc.respond(command.strip())
+            if output:
+                out.sendall(re.sub(r'\r?\n', '\r\n', output) + '\r\n')
+            out.sendall('\r\n' + PROMPT)
+        out.close()
+
+    def _read_line(self, channel, out, echo):
+        # returns one line typed into the channel, echoing it to out like a terminal when echo is True
+        buf = []
+        while True:
+            data = channel.recv(1)
+            if not data:
+                return None
+            char = data.decode('utf-8', 'replace')
+            if char in '\r\n':
+                if echo:
+                    out.sendall('\r\n')
+                return ''.join(buf)
+            buf.append(char)
+            if echo:
+                out.sendall(char)
+
+
+def process_cli():
+    parser = ArgumentParser(prog='fmd_simwlc', description='Simulated Cisco WLC for load testing fmd')
+    parser.add_argument('--host',
+        default='127.0.0.1',
+        help='Address to listen on, default = 127.0.0.1')
+    parser.add_argument('--port',
+        default=2222,
+        type=int,
+        help='SSH port to listen on, default = 2222')
+    parser.add_argument('--host-key',
+        help='RSA host key file, a new key is generated when not supplied')
+    parser.add_argument('--clients',
+        default=100,
+        type=int,
+        help='Number of simulated clients, default = 100')
+    parser.add_argument('--neighbours',
+        default=5,
+        type=int,
+        help='Neighbour WAPs per client, default = 5')
+    parser.add_argument('--waps',
+        default=100,
+        type=int,
+        help='Number of simulated WAPs, default = 100')
+    parser.add_argument('--latency',
+        default=0.0,
+        type=float,
+        help='Seconds added to every command, default = 0')
+    parser.add_argument('--jitter',
+        default=0.0,
+        type=float,
+        help='Random +/- seconds added to latency, default = 0')
+    parser.add_argument('--roam',
+        default=0.0,
+        type=float,
+        help='Chance a client roams each time it is queried, default = 0')
+    parser.add_argument('--down-waps',
+        default=0,
+        type=int,
+        help='Number of WAPs with their radios down, default = 0')
+    parser.add_argument('--rtt',
+        default=0.0,
+        type=float,
+        help='Network round trip seconds, unlike latency commands overlap, default = 0')
+    parser.add_argument('--list-macs',
+        action='store_true',
+        help='Print simulated client MACs and exit')
+    parser.add_argument('-d', '--debug',
+        action='store_true',
+        help='Enable debug output to console')
+    return parser.parse_args()
+
+
+def main():
+    args = process_cli()
+    logging.basicConfig(stream=sys.stdout,
+                        level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(message)s')
+    logger = logging.getLogger(__name__)
+
+    wlc = SimulatedWLC(args.clients, args.neighbours, args.waps, args.latency, args.jitter, args.roam, down_waps=args.down_waps)
+    if args.list_macs:
+        for mac in wlc.macs():
+            sys.stdout.write(mac + '\n')
+        return
+
+    server = SimulatedWLCServer(wlc, args.host, args.port, args.host_key, args.rtt)
+    logger.info('Simulated WLC listening on %s:%s with %s clients', server.host, server.port, args.clients)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info('Simulated WLC command counts %s', wlc.stats())
+
+
+if __name__ == '__main__':
+    main()
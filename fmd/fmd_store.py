@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+append-only on disk store for client samples with indexed queries
+
+samples are written to segment directories of fixed width column files, strings are interned
+into a per segment string table and each segment keeps an index of its time range and each MAC's
+time range. Segments without the MAC or WAP or outside the time range are skipped, the time range is
+found by binary search on the sample times and a closed segment's row lists give the rows of each
+MAC and WAP, so only those rows are read. Rows of a segment still being written, or left behind
+by a run that did not close its segment, are scanned for the MAC or WAP
+
+    segment/ts.col        float64 sample time, seconds since the epoch
+    segment/mac.col       uint32 string id of the client MAC
+    segment/ap.col        uint32 string id of the associated WAP
+    segment/ssid.col      uint32 string id of the SSID
+    segment/rssi.col      int16 RSSI dBm, NO_SIGNAL when unknown
+    segment/snr.col       int16 SNR dB, NO_SIGNAL when unknown
+    segment/nbr_start.col uint32 first row in the neighbour columns
+    segment/nbr_count.col uint16 neighbour count
+    segment/nbr_ap.col    uint32 string id of the neighbour WAP
+    segment/nbr_rssi.col  int16 neighbour average RSSI dBm
+    segment/strings.txt   string table, one string per line, line number is the string id
+    segment/mac_rows.col  uint32 rows of each MAC in turn, written when the segment is closed
+    segment/ap_rows.col   uint32 rows of each WAP in turn, written when the segment is closed
+    segment/index.json    rows, time range, per MAC time range and row count, per WAP row count
+                          and each MAC's and WAP's [offset, count] in the row lists
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import array
+import bisect
+import struct
+import logging
+from argparse import ArgumentParser
+from datetime import datetime
+
+import fmd_tools
+
+NO_SIGNAL = -32768
+SEGMENT_ROWS = 1000000
+FLUSH_ROWS = 1000
+FLUSH_SECS = 10
+
+# column name, array typecode
+SAMPLE_COLUMNS = (
+    ('ts', 'd'),
+    ('mac', 'I'),
+    ('ap', 'I'),
+    ('ssid', 'I'),
+    ('rssi', 'h'),
+    ('snr', 'h'),
+    ('nbr_start', 'I'),
+    ('nbr_count', 'H'),
+)
+NEIGHBOUR_COLUMNS = (
+    ('nbr_ap', 'I'),
+    ('nbr_rssi', 'h'),
+)
+# row numbers grouped by MAC or WAP
+ROW_LIST_COLUMNS = (
+    ('mac_rows', 'I'),
+    ('ap_rows', 'I'),
+)
+COLUMN_TYPES = dict(SAMPLE_COLUMNS + NEIGHBOUR_COLUMNS + ROW_LIST_COLUMNS)
+
+
+def _signal(value):
+    value = fmd_tools.parse_signal(value)
+    return NO_SIGNAL if value is None else value
+
+
+def _replace(src, dst):
+    # os.rename does not replace an existing file on windows
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+class SegmentWriter:
+    '''
+    appends samples to one segment, rows are buffered in arrays and written on flush
+    '''
+
+    def __init__(self, segment_dir):
+        self.segment_dir = segment_dir
+        os.makedirs(segment_dir)
+        self._strings = {}
+        self._strings_file = open(os.path.join(segment_dir, 'strings.txt'), 'ab')
+        self._files = {}
+        self._buffers = {}
+        for name, typecode in SAMPLE_COLUMNS + NEIGHBOUR_COLUMNS:
+            self._files[name] = open(os.path.join(segment_dir, name + '.col'), 'ab')
+            self._buffers[name] = array.array(typecode)
+        self._index = {'rows': 0, 'neighbours': 0, 'min_ts': None, 'max_ts': None, 'sorted': True, 'macs': {}, 'aps': {}}
+        # rows of each MAC and WAP, written as row lists on close
+        self._mac_rows = {}
+        self._ap_rows = {}
+
+    def rows(self):
+        return self._index['rows'] + self.buffered()
+
+    def buffered(self):
+        return len(self._buffers['ts'])
+
+    def append(self, ts, mac, client_details):
+        buffers = self._buffers
+        row = self.rows()
+        self._mac_rows.setdefault(mac, array.array('I')).append(row)
+        self._ap_rows.setdefault(client_details['WAP_Name'], array.array('I')).append(row)
+        neighbours = client_details.get('WAP_Neighbours', [])
+        buffers['ts'].append(ts)
+        buffers['mac'].append(self._intern(mac))
+        buffers['ap'].append(self._intern(client_details['WAP_Name']))
+        buffers['ssid'].append(self._intern(client_details['SSID']))
+        buffers['rssi'].append(_signal(client_details['Signal']))
+        buffers['snr'].append(_signal(client_details['SNR']))
+        buffers['nbr_start'].append(self._index['neighbours'] + len(buffers['nbr_ap']))
+        buffers['nbr_count'].append(len(neighbours))
+        for wap, avg_sig, timeout in neighbours:
+            buffers['nbr_ap'].append(self._intern(wap))
+            buffers['nbr_rssi'].append(int(avg_sig))
+
+        index = self._index
+        if index['min_ts'] is None:
+            index['min_ts'] = index['max_ts'] = ts
+        elif ts < index['max_ts']:
+            # the clock went backwards, time range queries have to scan this segment
+            index['sorted'] = False
+        index['min_ts'] = min(index['min_ts'], ts)
+        index['max_ts'] = max(index['max_ts'], ts)
+        mac_range = index['macs'].setdefault(mac, [ts, ts, 0])
+        mac_range[0] = min(mac_range[0], ts)
+        mac_range[1] = max(mac_range[1], ts)
+        mac_range[2] += 1
+        index['aps'][client_details['WAP_Name']] = index['aps'].get(client_details['WAP_Name'], 0) + 1
+
+    def flush(self):
+        '''
+        writes buffered rows and the segment index
+        '''
+        rows = len(self._buffers['ts'])
+        if not rows:
+            return
+        for name, typecode in SAMPLE_COLUMNS + NEIGHBOUR_COLUMNS:
+            buf = self._buffers[name]
+            buf.tofile(self._files[name])
+            self._files[name].flush()
+            if name == 'nbr_ap':
+                self._index['neighbours'] += len(buf)
+            self._buffers[name] = array.array(typecode)
+        self._strings_file.flush()
+        self._index['rows'] += rows
+        self._write_index()
+
+    def close(self):
+        '''
+        flushes buffered rows and writes the row lists of every MAC and WAP
+        '''
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._strings_file.close()
+        for name, rows_by_key in (('mac_rows', self._mac_rows), ('ap_rows', self._ap_rows)):
+            offsets = {}
+            offset = 0
+            with open(os.path.join(self.segment_dir, name + '.col'), 'wb') as f:
+                for key in sorted(rows_by_key):
+                    rows_by_key[key].tofile(f)
+                    offsets[key] = [offset, len(rows_by_key[key])]
+                    offset += len(rows_by_key[key])
+            self._index[name] = offsets
+        # rows before listed_rows are in the row lists
+        self._index['listed_rows'] = self._index['rows']
+        self._write_index()
+
+    def _write_index(self):
+        index_file = os.path.join(self.segment_dir, 'index.json')
+        with open(index_file + '.tmp', 'w') as f:
+            json.dump(self._index, f)
+        _replace(index_file + '.tmp', index_file)
+
+    def _intern(self, value):
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings)
+            self._strings_file.write(value.encode('utf-8') + b'\n')
+        return string_id
+
+
+class SampleWriter:
+    '''
+    appends samples to a store, starting a new segment every SEGMENT_ROWS rows
+    '''
+
+    def __init__(self, store, clock=time.time):
+        self._store = store
+        self._clock = clock
+        self._segment = None
+        self._last_flush = clock()
+
+    def append(self, mac, client_details, ts=None):
+        '''
+        stores an associated client's sample, samples of unassociated clients are ignored
+        '''
+        if not client_details['Status']:
+            return
+        if self._segment is None or self._segment.rows() >= SEGMENT_ROWS:
+            if self._segment is not None:
+                self._segment.close()
+            self._segment = SegmentWriter(self._store.new_segment_dir())
+        now = self._clock()
+        self._segment.append(now if ts is None else ts, mac, client_details)
+        if self._segment.buffered() >= FLUSH_ROWS or now - self._last_flush >= FLUSH_SECS:
+            self.flush()
+
+    def flush(self):
+        if self._segment is not None:
+            self._segment.flush()
+        self._last_flush = self._clock()
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+class SegmentReader:
+    '''
+    memory maps a segment's columns, index.json is rebuilt from the columns if it is missing
+    '''
+
+    def __init__(self, segment_dir):
+        self.segment_dir = segment_dir
+        with open(os.path.join(segment_dir, 'strings.txt'), 'rb') as f:
+            self.strings = [line.rstrip(b'\n').decode('utf-8') for line in f]
+        self.string_ids = dict((value, string_id) for string_id, value in enumerate(self.strings))
+        self._columns = {}
+        index_file = os.path.join(segment_dir, 'index.json')
+        if os.path.isfile(index_file):
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = self._rebuild_index()
+
+    def column(self, name, start=0, stop=None):
+        '''
+        returns rows start to stop of a column as an array
+        '''
+        values = array.array(COLUMN_TYPES[name])
+        if stop is None:
+            stop = self.index['neighbours'] if name in dict(NEIGHBOUR_COLUMNS) else self.index['rows']
+        if stop <= start:
+            return values
+        mapped = self._map(name)
+        chunk = mapped[start * values.itemsize:stop * values.itemsize]
+        if hasattr(values, 'frombytes'):
+            values.frombytes(chunk)
+        else:
+            values.fromstring(chunk)
+        return values
+
+    def value(self, name, row):
+        '''
+        returns one row of a column
+        '''
+        typecode = COLUMN_TYPES[name]
+        return struct.unpack_from(typecode, self._map(name), row * struct.calcsize(typecode))[0]
+
+    def rows_of(self, mac=None, ap=None, start=0, stop=None):
+        '''
+        returns the rows from start to stop holding mac and ap, read from the row lists of a closed
+        segment and scanned from the mac and ap columns for rows that are not listed
+        '''
+        if stop is None:
+            stop = self.index['rows']
+        rows = []
+        scan_start = start
+        listed = min(self.index.get('listed_rows', 0), stop)
+        if (mac is not None or ap is not None) and listed > start:
+            name, key = ('mac_rows', mac) if mac is not None else ('ap_rows', ap)
+            run = self.index[name].get(key)
+            if run is not None:
+                listed_rows = self.column(name, run[0], run[0] + run[1])
+                rows = listed_rows[bisect.bisect_left(listed_rows, start):bisect.bisect_left(listed_rows, listed)]
+                if mac is not None and ap is not None:
+                    ap_id = self.string_ids.get(ap)
+                    rows = [row for row in rows if self.value('ap', row) == ap_id]
+            scan_start = listed
+        rows = list(rows)
+        if scan_start < stop:
+            mac_id = self.string_ids.get(mac)
+            ap_id = self.string_ids.get(ap)
+            macs = self.column('mac', scan_start, stop)
+            aps = self.column('ap', scan_start, stop)
+            rows.extend(scan_start + row for row in range(stop - scan_start)
+                        if (mac is None or macs[row] == mac_id) and (ap is None or aps[row] == ap_id))
+        return rows
+
+    def rows_between(self, since=None, until=None):
+        '''
+        returns the row range holding since <= time <= until, a binary search on the mapped sample
+        times unless the segment's sample times went backwards
+        '''
+        rows = self.index['rows']
+        if not self.index.get('sorted', True) or not rows:
+            return 0, rows
+        start = 0 if since is None else self._search_ts(since, rows, False)
+        stop = rows if until is None else self._search_ts(until, rows, True)
+        return start, stop
+
+    def close(self):
+        for f, mapped in self._columns.values():
+            mapped.close()
+            f.close()
+        self._columns = {}
+
+    def _search_ts(self, value, rows, right):
+        # bisect.bisect_left or bisect_right reading only the probed times from the map
+        low, high = 0, rows
+        while low < high:
+            middle = (low + high) // 2
+            ts = self.value('ts', middle)
+            if ts < value or (right and ts == value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _map(self, name):
+        if name not in self._columns:
+            f = open(os.path.join(self.segment_dir, name + '.col'), 'rb')
+            self._columns[name] = f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._columns[name][1]
+
+    def _rebuild_index(self):
+        # rows are only complete once every sample column has been written
+        sizes = []
+        for name, typecode in SAMPLE_COLUMNS:
+            path = os.path.join(self.segment_dir, name + '.col')
+            sizes.append(os.path.getsize(path) // array.array(typecode).itemsize)
+        index = {'rows': min(sizes), 'neighbours': 0, 'min_ts': None, 'max_ts': None, 'sorted': True, 'macs': {}, 'aps': {}}
+        path = os.path.join(self.segment_dir, 'nbr_ap.col')
+        index['neighbours'] = os.path.getsize(path) // array.array('I').itemsize
+        self.index = index
+        if not index['rows']:
+            return index
+        ts = self.column('ts')
+        macs = self.column('mac')
+        aps = self.column('ap')
+        index['min_ts'], index['max_ts'] = min(ts), max(ts)
+        index['sorted'] = all(ts[row] <= ts[row + 1] for row in range(len(ts) - 1))
+        for row in range(index['rows']):
+            mac_range = index['macs'].setdefault(self.strings[macs[row]], [ts[row], ts[row], 0])
+            mac_range[0] = min(mac_range[0], ts[row])
+            mac_range[1] = max(mac_range[1], ts[row])
+            mac_range[2] += 1
+            ap = self.strings[aps[row]]
+            index['aps'][ap] = index['aps'].get(ap, 0) + 1
+        return index
+
+
+class SampleStore:
+    '''
+    directory of sample segments
+    '''
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+    def segment_dirs(self):
+        return [os.path.join(self.store_dir, name) for name in sorted(os.listdir(self.store_dir)) if name.startswith('seg-')]
+
+    def new_segment_dir(self):
+        # segment names sort in time order, the pid keeps concurrent fmd runs apart
+        return os.path.join(self.store_dir, 'seg-%s-%06d-%s' % (datetime.now().strftime('%Y%m%d%H%M%S'), len(self.segment_dirs()), os.getpid()))
+
+    def writer(self):
+        return SampleWriter(self)
+
+    def query(self, mac=None, ap=None, since=None, until=None):
+        '''
+        yields sample dictionaries matching all of the given MAC, WAP and time range in time order per segment
+
+        only segments whose index covers the time range and contains the MAC or WAP are read, a MAC's
+        own time range in the segment narrows the time range and only the MAC's or WAP's rows are read
+        '''
+        for segment_dir in self.segment_dirs():
+            segment = SegmentReader(segment_dir)
+            try:
+                index = segment.index
+                if not index['rows']:
+                    continue
+                if since is not None and index['max_ts'] < since:
+                    continue
+                if until is not None and index['min_ts'] > until:
+                    continue
+                if mac is not None and mac not in index['macs']:
+                    continue
+                if mac is not None and ((since is not None and index['macs'][mac][1] < since) or (until is not None and index['macs'][mac][0] > until)):
+                    continue
+                if ap is not None and ap not in index['aps']:
+                    continue
+                for sample in self._query_segment(segment, mac, ap, since, until):
+                    yield sample
+            finally:
+                segment.close()
+
+    def _query_segment(self, segment, mac, ap, since, until):
+        if mac is not None:
+            # the MAC's first and last sample in this segment narrow the rows searched
+            first, last = segment.index['macs'][mac][:2]
+            since = first if since is None else max(since, first)
+            until = last if until is None else min(until, last)
+        start, stop = segment.rows_between(since, until)
+        if stop <= start:
+            return
+        # rows_between is exact when sample times are sorted
+        timed = not segment.index.get('sorted', True)
+        strings = segment.strings
+        for row in segment.rows_of(mac, ap, start, stop):
+            ts = segment.value('ts', row)
+            if timed and ((since is not None and ts < since) or (until is not None and ts > until)):
+                continue
+            rssi = segment.value('rssi', row)
+            snr = segment.value('snr', row)
+            nbr_start = segment.value('nbr_start', row)
+            nbr_stop = nbr_start + segment.value('nbr_count', row)
+            nbr_ap = segment.column('nbr_ap', nbr_start, nbr_stop)
+            nbr_rssi = segment.column('nbr_rssi', nbr_start, nbr_stop)
+            yield {
+                'ts': ts,
+                'mac': strings[segment.value('mac', row)],
+                'ap': strings[segment.value('ap', row)],
+                'ssid': strings[segment.value('ssid', row)],
+                'rssi': None if rssi == NO_SIGNAL else rssi,
+                'snr': None if snr == NO_SIGNAL else snr,
+                'neighbours': [(strings[nbr_ap[i]], nbr_rssi[i]) for i in range(len(nbr_ap))],
+            }
+
+
+def parse_time(value):
+    '''
+    converts 'YYYY-MM-DD HH:MM[:SS]', 'YYYY-MM-DDTHH:MM[:SS]', 'YYYY-MM-DD' or epoch seconds to epoch seconds
+
+    Raises:
+        ValueError: if the time is not in a known format
+    '''
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.strptime(value, time_format).timetuple())
+        except ValueError:
+            continue
+    raise ValueError('Invalid time %s' % value)
+
+
+def process_query_cli(argv):
+    parser = ArgumentParser(prog='fmd query',
+        description='Queries client samples recorded with fmd --store')
+    parser.add_argument('-mac', '--mac',
+        help='Client MAC address')
+    parser.add_argument('-ap', '--ap',
+        help='WAP name')
+    parser.add_argument('-s', '--since',
+        type=parse_time,
+        metavar=('{YYYY-MM-DD HH:MM:SS}'),
+        help='Only samples at or after this time')
+    parser.add_argument('-u', '--until',
+        type=parse_time,
+        metavar=('{YYYY-MM-DD HH:MM:SS}'),
+        help='Only samples at or before this time')
+    parser.add_argument('-j', '--json',
+        action="store_true",
+        help='Output samples as JSON Lines')
+    args = parser.parse_args(argv)
+    if args.mac is None and args.ap is None:
+        parser.error('one of --mac or --ap is required')
+    return args
+
+
+def query_main(argv, store_dir, standard_mac):
+    '''
+    fmd query subcommand, writes matching samples to stdout
+
+    Args:
+        standard_mac: converts a MAC to the standard format samples are stored with
+    '''
+    args = process_query_cli(argv)
+    mac = None
+    if args.mac:
+        mac = standard_mac(args.mac)
+
+    store = SampleStore(store_dir)
+    count = 0
+    for sample in store.query(mac, args.ap, args.since, args.until):
+        count += 1
+        if args.json:
+            sys.stdout.write(json.dumps(sample, sort_keys=True) + '\n')
+        else:
+            sys.stdout.write('%s MAC %s WAP %s SSID %s SS %s SNR %s\n' % (
+                datetime.fromtimestamp(sample['ts']).strftime('%Y-%m-%d %H:%M:%S'),
+                sample['mac'], sample['ap'], sample['ssid'], sample['rssi'], sample['snr']))
+    logging.getLogger(__name__).debug('Query - %s samples found', count)
+    return count
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+generates synthetic WLC output for benchmarking and testing without a WLC
+"""
+import random
+
+SSIDS = ('Corp', 'Guest', 'Voice')
+
+
+def synthetic_mac(index, prefix=0x0211):
+    '''
+    returns a standard lower case MAC address unique to index
+    '''
+    value = (prefix << 32) | (index & 0xffffffff)
+    raw = '%012x' % value
+    return ':'.join(raw[i:i + 2] for i in range(0, 12, 2))
+
+
+def synthetic_wap_name(index):
+    return 'AP-%dF-%02d' % (index // 20 + 1, index % 20 + 1)
+
+
+def client_detail(client, indent=''):
+    '''
+    returns show client detail output for a client dictionary from synthetic_clients
+
+    Args:
+        indent: prefixed to every line, '  ' gives the indented test script output
+    '''
+    lines = [
+        'Client MAC Address............................... %s' % client['mac'],
+        'Client Username ................................. %s' % client['username'],
+        'AP MAC Address................................... %s' % client['wap_mac'],
+        'AP Name.......................................... %s' % client['wap_name'],
+        'AP radio slot Id................................. 1',
+        'Client State..................................... Associated',
+        'Client User Group................................ ',
+        'Client NAC OOB State............................. Access',
+        'Wireless LAN Id.................................. %s' % client['wlan_id'],
+        'Wireless LAN Network Name (SSID)................. %s' % client['ssid'],
+        'Wireless LAN Profile Name........................ %s' % client['ssid'],
+        'Hotspot (802.11u)................................ Not Supported',
+        'BSSID............................................ %s' % client['wap_mac'],
+        'Connected For ................................... 3600 secs',
+        'Channel.......................................... 36',
+        'IP Address....................................... 10.0.%d.%d' % (client['index'] // 250 % 250, client['index'] % 250 + 1),
+        'Gateway Address.................................. 10.0.0.1',
+        'Netmask.......................................... 255.255.0.0',
+        'Association Id................................... 1',
+        'Authentication Algorithm......................... Open System',
+        'Reason Code...................................... 1',
+        'Status Code...................................... 0',
+        'Session Timeout.................................. 1800',
+        'Client CCX version............................... No CCX support',
+        'Mobility State................................... Local',
+        'Policy Manager State............................. RUN',
+        'Policy Type...................................... WPA2',
+        'Encryption Cipher................................ CCMP (AES)',
+        'Interface........................................ management',
+        'VLAN............................................. 10',
+        'Quality of Service Level......................... Silver',
+        'Client Capabilities:',
+        '      CF Pollable................................ Not implemented',
+        '      Short Preamble............................. Not implemented',
+        '    Client Statistics:',
+        '      Number of Bytes Received................... 123456',
+        '      Number of Bytes Sent....................... 654321',
+        '      Number of Packets Received................. 1234',
+        '      Number of Packets Sent..................... 4321',
+        '      Number of Policy Errors.................... 0',
+        '      Radio Signal Strength Indicator............ %s' % client['signal'],
+        '      Signal to Noise Ratio...................... %s' % client['snr'],
+        '    Nearby AP Statistics:',
+    ]
+    for wap_name, secs, dbm in client['neighbours']:
+        lines.append('          %s(slot 1)' % wap_name)
+        lines.append('            antenna0: %s sec ago.................... %s dBm' % (secs, dbm))
+        lines.append('            antenna1: %s sec ago.................... %s dBm' % (secs, dbm - 2))
+    lines.append('')
+    return '\n'.join(indent + line for line in lines)
+
+
+def client_summary(clients):
+    '''
+    returns show client summary output for a list of client dictionaries
+    '''
+    lines = [
+        'Number of Clients................................ %s' % len(clients),
+        '',
+        'MAC Address       AP Name                        Slot Status        WLAN  Auth Protocol         Port Wired  PMIPV6   Role',
+        '----------------- ------------------------------ ---- ------------- ----- ---- ---------------- ---- ------ -------  --------',
+    ]
+    for client in clients:
+        lines.append('%-17s %-30s %4s %-13s %5s %-4s %-16s %4s %-6s %-8s %s' % (
+            client['mac'], client['wap_name'], 1, 'Associated', client['wlan_id'], 'Yes', '802.11ac(5 GHz)', 1, 'No', 'No', 'Local'))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def client_username(clients):
+    '''
+    returns show client username output for the client dictionaries of one username
+    '''
+    lines = [
+        'MAC Address       AP Name           Status        WLAN  Auth Protocol         Port Wired',
+        '----------------- ----------------- ------------- ----  ---- ---------------- ---- -----',
+    ]
+    for client in clients:
+        lines.append('%-17s %-17s %-13s %-4s  %-4s %-16s %-4s %s' % (
+            client['mac'], client['wap_name'], 'Associated', client['wlan_id'], 'Yes', '802.11ac(5 GHz)', 1, 'No'))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def wlan_summary():
+    '''
+    returns show wlan summary output for the WLANs synthetic clients use
+    '''
+    lines = [
+        'Number of WLANs.................................. %s' % len(SSIDS),
+        '',
+        'WLAN ID  WLAN Profile Name / SSID               Status    Interface Name        PMIPv6 Mobility',
+        '-------  -------------------------------------  --------  --------------------  ---------------',
+    ]
+    for wlan_id, ssid in enumerate(SSIDS, 1):
+        lines.append('%-8s %-38s %-9s %-21s %s' % (wlan_id, '%s / %s' % (ssid, ssid), 'Enabled', 'management', 'none'))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def ap_summary(wap_count):
+    '''
+    returns show ap summary output for wap_count WAPs
+    '''
+    lines = [
+        'Number of APs.................................... %s' % wap_count,
+        '',
+        'Global AP User Name.............................. Not Configured',
+        'Global AP Dot1x User Name........................ Not Configured',
+        '',
+        'AP Name             Slots  AP Model              Ethernet MAC       Location          Country     IP Address       Clients   DSE Location',
+        '------------------  -----  --------------------  -----------------  ----------------  ----------  ---------------  --------  --------------',
+    ]
+    for index in range(wap_count):
+        lines.append('%-19s %-6s %-21s %-18s %-17s %-11s %-16s %-9s %s' % (
+            synthetic_wap_name(index), 2, 'AIR-AP2802I-Z-K9', synthetic_mac(index, prefix=0x00aa), 'default location', 'AU',
+            '10.1.%d.%d' % (index // 250, index % 250 + 1), 0, '[0 ,0 ,0 ]'))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def radio_summary(wap_count, slot, down=()):
+    '''
+    returns show advanced 802.11a or 802.11b summary output, radios of WAPs in down are DOWN
+    '''
+    lines = [
+        'Member RRM Information',
+        'AP Name            MAC Address        Slot   Admin   Oper    Channel     TxPower',
+        '-----------------  -----------------  ----   -----   ----    -------     -------',
+    ]
+    for index in range(wap_count):
+        lines.append('%-18s %-18s %-6s %-7s %-7s %-11s %s' % (
+            synthetic_wap_name(index), synthetic_mac(index, prefix=0x00aa), slot, 'ENABLED',
+            'DOWN' if index in down else 'UP', '36' if slot else '1', '*1/8 (20 dBm)'))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def synthetic_client(index, neighbour_count, wap_count=100, rng=random):
+    '''
+    returns a client dictionary associated to a random WAP with neighbour_count neighbouring WAPs
+    '''
+    wap_index = rng.randrange(wap_count)
+    rssi = rng.randint(-85, -35)
+    neighbours = []
+    for offset in range(1, neighbour_count + 1):
+        neighbour_index = (wap_index + offset) % max(wap_count, 1)
+        neighbours.append((synthetic_wap_name(neighbour_index), rng.randint(0, 59), rssi - rng.randint(0, 30)))
+    wlan_id = rng.randint(1, len(SSIDS))
+    return {
+        'index': index,
+        'mac': synthetic_mac(index),
+        'username': 'user%04d' % index,
+        'wap_mac': synthetic_mac(wap_index, prefix=0x00aa),
+        'wap_name': synthetic_wap_name(wap_index),
+        'wlan_id': wlan_id,
+        'ssid': SSIDS[wlan_id - 1],
+        'signal': '%s dBm' % rssi,
+        'snr': '%s dB' % (rssi + 95),
+        'neighbours': neighbours,
+    }
+
+
+def synthetic_clients(count, neighbour_count, wap_count=100, seed=0):
+    '''
+    returns count client dictionaries, the same seed always gives the same clients
+    '''
+    rng = random.Random(seed)
+    return [synthetic_client(index, neighbour_count, wap_count, rng) for index in range(count)]
@@ -118,6 +118,24 @@ def format_time(seconds):
     h, m = divmod(m, 60)
     formatted_time = "%d:%02d:%02d" % (h, m, s)
     return formatted_time    
+
+def parse_signal(value):
+    '''
+    Converts a WLC signal value like '-45 dBm' or '50 dB' to an int
+
+    Returns None for values like 'Unknown' or 'Not Detected'
+    '''
+    try:
+        return int(value.split()[0])
+    except (ValueError, IndexError, AttributeError):
+        return None
+    
+def client_timed_out(client_details):
+    '''
+    True when an associated client has a known signal but no neighbour WAPs heard it, the client
+    has not spoken to the WLC in more than 60 seconds and the WLC keeps its association for 5 minutes
+    '''
+    return client_details['Signal'] != 'Unknown' and len(client_details['WAP_Neighbours']) == 0
     
 def check_write_dir(test_dir):
     if not os.access(test_dir, os.W_OK):
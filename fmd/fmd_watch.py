@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+reverse index of WAP name, SSID and username to client MACs for watching groups of clients
+
+the index is refreshed from bulk WLC output, show client summary for WAPs and SSIDs and
+show client username for usernames, and only clients whose WAP, SSID or username changed
+move between sets so every lookup is a set union
+"""
+
+KINDS = ('wap', 'ssid', 'username')
+
+
+class ClientIndex:
+    '''
+    WAP name, SSID and username to sets of cleaned MACs
+    '''
+
+    def __init__(self):
+        self._index = dict((kind, {}) for kind in KINDS)
+        self._values = dict((kind, {}) for kind in KINDS)
+
+        self.moves = 0
+
+    def update_summary(self, summary, wlans):
+        '''
+        updates WAP and SSID membership from a client summary, clients no longer associated are removed
+
+        Args:
+            summary: clients from ProfileClientSummary
+            wlans: WLAN id to SSID from ProfileWlanSummary
+        '''
+        seen = set()
+        for mac, client in summary.items():
+            if not client['Associated']:
+                continue
+            seen.add(mac)
+            self._set('wap', mac, client['WAP_Name'])
+            self._set('ssid', mac, wlans.get(client['WLAN_ID']))
+        for kind in ('wap', 'ssid'):
+            for mac in [mac for mac in self._values[kind] if mac not in seen]:
+                self._set(kind, mac, None)
+
+    def update_username(self, username, macs):
+        '''
+        sets the cleaned MACs of one username
+        '''
+        macs = set(macs)
+        for mac in [mac for mac in self._index['username'].get(username, ()) if mac not in macs]:
+            self._set('username', mac, None)
+        for mac in macs:
+            self._set('username', mac, username)
+
+    def lookup(self, kind, value):
+        return self._index[kind].get(value, set())
+
+    def select(self, waps=(), ssids=(), usernames=()):
+        '''
+        Returns:
+            set of cleaned MACs on any of waps, ssids or usernames
+        '''
+        selected = set()
+        for kind, values in (('wap', waps), ('ssid', ssids), ('username', usernames)):
+            for value in values or ():
+                selected |= self.lookup(kind, value)
+        return selected
+
+    def stats(self):
+        return dict((kind, len(self._index[kind])) for kind in KINDS)
+
+    def _set(self, kind, mac, value):
+        values = self._values[kind]
+        old = values.get(mac)
+        if old == value:
+            return
+        index = self._index[kind]
+        if old is not None:
+            members = index[old]
+            members.discard(mac)
+            if not members:
+                del index[old]
+        if value is None:
+            values.pop(mac, None)
+        else:
+            values[mac] = value
+            index.setdefault(value, set()).add(mac)
+        self.moves += 1